@@ -1,48 +1,211 @@
-import os
 import streamlit as st
+import pandas as pd
+import time
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import StringIO
-from utils.preprocessing import preprocess
-import altair as alt
-from matplotlib import pyplot as plt
+from utils.columnar import preprocess_cached
+from utils.preprocessing import ExportTooLarge
+from utils.store import preprocess_incremental
+from utils.cache import LRUCache, content_hash
+from utils.indexing import select_window, time_index
 from numerize import numerize
 
 from utils.helpers import (
     fetch_messages,
     fetch_stats, 
     fetch_active_users, 
-    get_wordcloud, 
+    wordcloud_image,
     most_common_emojis,
     get_timelines,
     timeline_stats,
     get_activity_map,
+    conversation_stats,
+    get_reply_map,
+    get_response_times,
 )
 
-from utils.topic_model import get_topics
-
-import seaborn as sns
-sns.set()
+from utils.topic_model import (
+    TOPIC_ENGINE, TOPIC_ENGINES, TOPIC_WORKERS, find_topic_words, topic_clouds, topic_messages,
+)
+from utils.profiling import collect, profile, summary
 
 
 PAGE_CONFIG = {"page_title":"App by Glad Nayak","page_icon":":smiley:","layout":"centered"}
 st.set_page_config(**PAGE_CONFIG)
 
+# parsed chats are large, stats and plots are small
+CHAT_CACHE_ENTRIES = 4
+RESULT_CACHE_ENTRIES = 256
+
+# calls listed in the performance panel of a session
+PERFORMANCE_RECORDS = 100
+
+# topic engines as listed in the sidebar
+TOPIC_ENGINE_NAMES = {'top2vec': 'Top2Vec', 'nmf': 'TF-IDF and NMF, fast'}
+
+
+@st.experimental_singleton
+def get_caches():
+    """
+    Bounded LRU caches shared by all sessions,
+    keyed by the content hash of uploaded files
+    """
+    return LRUCache(CHAT_CACHE_ENTRIES), LRUCache(RESULT_CACHE_ENTRIES)
+
+
+def new_topic_pool():
+    return ProcessPoolExecutor(TOPIC_WORKERS, mp_context=mp.get_context('spawn'))
+
+
+@st.experimental_singleton
+def get_topic_jobs():
+    """
+    Pool of topic modelling processes shared by all sessions, held in a dict so that
+    a broken pool can be replaced, and the running or finished job of each upload
+    """
+    return {'pool': new_topic_pool()}, LRUCache(RESULT_CACHE_ENTRIES), threading.Lock()
+
+
+def submit_topics(workers, messages, engine):
+    """
+    Submit topic modelling of messages to the pool, a pool broken by a worker that died,
+    such as one killed for running out of memory, is replaced by a new one
+    """
+    try:
+        return workers['pool'].submit(find_topic_words, messages, engine)
+
+    except BrokenProcessPool:
+        workers['pool'].shutdown(wait=False)
+        workers['pool'] = new_topic_pool()
+        return workers['pool'].submit(find_topic_words, messages, engine)
+
+
+def topic_job(digest, chats, engine):
+    """
+    Topic modelling job of an upload with engine and the time it was submitted,
+    submitted to the pool by the first session that asks for it,
+    and submitted again by the next session that asks for it once it failed
+    """
+    workers, jobs, lock = get_topic_jobs()
+    key = (digest, engine)
+    with lock:
+        job = jobs.get(key)
+        if job is not None and job[0].done() and (job[0].cancelled() or job[0].exception() is not None):
+            jobs.pop(key)
+            job = None
+
+    if job is not None:
+        return job
+
+    # the documents of the whole chat are built outside the lock every session shares,
+    # a session that submitted the job meanwhile wins
+    messages = topic_messages(chats, engine)
+    with lock:
+        if key not in jobs:
+            jobs.put(key, (submit_topics(workers, messages, engine), time.time()))
+
+        return jobs.get(key)
+
+
+def upload_digest(uploaded_file):
+    """
+    Content hash of uploaded file, computed once per upload in a session
+    """
+    key = f'digest-{uploaded_file.id}'
+    if key not in st.session_state:
+        st.session_state[key] = content_hash(uploaded_file.getvalue())
+
+    return st.session_state[key]
+
+
+def cached(cache, digest, fn, *args):
+    """
+    Memoize fn(*args) for an upload, dataframes are identified by digest,
+    other arguments such as the selected user are part of the key
+    """
+    key = (digest, fn.__name__) + tuple(arg for arg in args if not isinstance(arg, pd.DataFrame))
+    return cache.get_or_compute(key, fn, *args)
+
+
+def date_window(chats_with_date, chats):
+    """
+    First and last day of the messages to analyse picked in the sidebar,
+    or None for the whole chat
+    """
+    datetimes = time_index(chats, chats_with_date).datetimes
+    first, last = pd.Timestamp(datetimes[0]).date(), pd.Timestamp(datetimes[-1]).date()
+    picked = st.sidebar.date_input('Messages sent between', value=(first, last), min_value=first, max_value=last)
+
+    # a range is picked in two clicks, the whole chat is shown until the last day is picked
+    if not isinstance(picked, (tuple, list)) or len(picked) != 2 or tuple(picked) == (first, last):
+        return None
+
+    return tuple(picked)
+
+
+def performance_panel(records):
+    """
+    Sidebar panel of the time and memory of the latest calls of the session,
+    results served from the caches take no calls
+    """
+    history = st.session_state['performance'] if 'performance' in st.session_state else []
+    history = (history + records)[-PERFORMANCE_RECORDS:]
+    st.session_state['performance'] = history
+
+    with st.sidebar.expander('Performance'):
+        if not history:
+            st.text('Nothing computed yet')
+            return
+
+        table = summary(history[::-1]).round({'wall_s': 3, 'cpu_s': 3, 'peak_mb': 1})
+        st.dataframe(table)
+
+
 def main():
+    """
+    Render UI on web app, and the performance panel of the calls it made
+    """
+    with collect() as records:
+        result = dashboard()
+
+    performance_panel(records)
+    return result
+
+
+def dashboard():
     """
     Render UI on web app, fetch and display data using utils.py
     """
     st.title("WhatsApp Chat Analysis")
-    uploaded_file = st.sidebar.file_uploader("Choose a file")
+    uploaded_file = st.sidebar.file_uploader("Choose a file", type=['txt', 'zip'])
+    incremental = st.sidebar.checkbox('Keep history, and only process new messages of later exports')
     if not uploaded_file:
-            st.subheader('Upload exported text file to see analysis')
+            st.subheader('Upload exported text file, or zipped export, to see analysis')
         
     if uploaded_file:
-        try:
-            # save the file, and pass the filename to preprocess function
-            with open(os.path.join(".", uploaded_file.name),"wb") as f:
-                f.write(uploaded_file.getbuffer())
+        chat_cache, result_cache = get_caches()
+        digest = upload_digest(uploaded_file)
 
-            chats_with_date, chats = preprocess(uploaded_file.name)
+        # with history kept, the frames hold every stored message of the chat, not just this upload
+        if incremental:
+            digest += '-history'
+
+        try:
+            # parse the uploaded buffer directly, once per distinct upload,
+            # uploads seen before are read back from the frame cache on disk
+            uploaded_file.seek(0)
+            if incremental:
+                chats_with_date, chats = chat_cache.get_or_compute(digest, preprocess_incremental, uploaded_file)
+            else:
+                chats_with_date, chats = chat_cache.get_or_compute(digest, preprocess_cached, uploaded_file, digest)
         
+        except ExportTooLarge as exc:
+            st.text(str(exc))
+            return -1
+
         except:
             st.text('Failed to read the exported file. Try again')
             return -1
@@ -55,13 +218,21 @@ def main():
         
         # 1. Show stats based on selected user
         user = st.sidebar.selectbox('Show analysis wrt', users)
+        engine = st.sidebar.selectbox('Topic model', TOPIC_ENGINES, index=TOPIC_ENGINES.index(TOPIC_ENGINE),
+                                      format_func=lambda engine: TOPIC_ENGINE_NAMES[engine])
+
+        # stats, activity, and active users of a window are answered by the time index,
+        # other sections are computed on the messages of the window, cached apart from the whole chat
+        window = date_window(chats_with_date, chats)
+        view = digest if window is None else f'{digest}-{window[0]}-{window[1]}'
+        window_chats_with_date, window_chats = (select_window(df, window) for df in (chats_with_date, chats))
 
         user_title = f'Showing Analysis for {user}' if user != 'Overall' else 'Showing Overall Analysis'
         st.subheader(user_title)
 
         headers = ['Members', 'Messages', 'Words', 'Media Uploaded', 'Links Shared']
         stats = [chats.id.nunique()]
-        stats.extend(fetch_stats(chats, user))
+        stats.extend(cached(result_cache, view, fetch_stats, chats, user, window))
 
         # don't show total members for personal conversations
         headers = headers[1:] if user != 'Overall' else headers
@@ -74,7 +245,7 @@ def main():
 
 
         # 2. display dataframe
-        st.dataframe(fetch_messages(chats, user))
+        st.dataframe(fetch_messages(window_chats, user))
 
 
         # 3. plot activity map of user
@@ -82,18 +253,20 @@ def main():
         st.subheader(title)
 
         headers = ['Active Days', 'First Message on', 'Last Message on']
-        for header, column, value in zip(headers, st.columns(3), timeline_stats(chats, user)):
+        for header, column, value in zip(headers, st.columns(3), cached(result_cache, view, timeline_stats, chats, user, window)):
             with column:
                 st.metric(label=header, value=value)
 
-        st.altair_chart(get_activity_map(chats, user), use_container_width=True)
+        st.altair_chart(cached(result_cache, view, get_activity_map, chats, user, window), use_container_width=True)
 
 
         # 4. Show Overall stats
         if user == 'Overall':
+            import altair as alt
+
             headers = ['Most Active', 'Most Active(%)']
             functions = [st.bar_chart, st.table]
-            top_users, top_users_percent = fetch_active_users(chats)
+            top_users, top_users_percent = cached(result_cache, view, fetch_active_users, chats, window)
         
             col1, col2 = st.columns(2)
 
@@ -128,22 +301,32 @@ def main():
                 st.dataframe(top_users_percent)
 
 
-        # 5. Plot word clouds
+        # 5. Show conversations, split at an hour without messages, who replies to whom, and how fast
+        st.subheader('Conversations' if user == 'Overall' else f'Conversations of {user}')
+        headers = ['Conversations', 'Messages each', 'Minutes each', 'Minutes to Reply']
+        for header, column, value in zip(headers, st.columns(4), cached(result_cache, view, conversation_stats, window_chats, user)):
+            with column:
+                st.metric(label=header, value=value)
+
+        st.altair_chart(cached(result_cache, view, get_reply_map, window_chats, user), use_container_width=True)
+        if user == 'Overall':
+            st.subheader('Median Minutes to Reply')
+            st.altair_chart(cached(result_cache, view, get_response_times, window_chats), use_container_width=True)
+
+
+        # 6. Plot word clouds
         try:
             st.subheader('Word Cloud')
-            wc = get_wordcloud(chats, user)
-            fig, ax = plt.subplots()
-            ax.imshow(wc)
-            plt.axis('off')
-            st.pyplot(fig)
+            # rendered once per chat and user, no figure is kept around per rerun
+            st.image(cached(result_cache, view, wordcloud_image, window_chats, user), use_column_width=True)
 
         except:
             st.text("There's been lot of silence lately...")
 
 
-        # 6. plot metrics on words
+        # 7. plot metrics on words
         header = 'Most Common Emojis'
-        table = most_common_emojis(chats, user)
+        table = cached(result_cache, view, most_common_emojis, window_chats, user)
         st.subheader(header)
         try:
             st.altair_chart(table, use_container_width=True)
@@ -157,26 +340,46 @@ def main():
             st.text(filler)
 
 
-        # 7. display timelines
-        stats = get_timelines(chats_with_date, user)
+        # 8. display timelines
+        stats = cached(result_cache, view, get_timelines, window_chats_with_date, user)
         for timeline_plot in stats:
             st.plotly_chart(timeline_plot, use_container_width=True)
 
         
-        # 8. display topics
-        topics = get_topics(chats)
-        if topics:
-            st.subheader('Learning what members are talking about using Topic Modelling')
-            for idx, wc in enumerate(topics):
-                try:
-                    st.subheader(f'Topic {idx+1}')
-                    fig, ax = plt.subplots()
-                    ax.imshow(wc)
-                    plt.axis('off')
-                    st.pyplot(fig)
-
-                except:
-                    st.text("")
+        # 9. display topics of the whole chat, learnt in the background while the sections above are shown
+        st.subheader('Learning what members are talking about using Topic Modelling')
+        status = st.empty()
+        job, submitted = topic_job(digest, chats, engine)
+        with profile('wait_for_topics', len(chats)):
+            while not job.done():
+                state = 'Learning topics' if job.running() else 'Waiting for a free topic modelling worker'
+                status.text(f'{state}... {time.time() - submitted:.0f}s')
+                time.sleep(1)
+
+        # failed jobs are submitted again by the next run
+        failed = job.cancelled() or job.exception() is not None
+        try:
+            topics = result_cache.get_or_compute((digest, 'topic_clouds', engine), topic_clouds, job.result())
+
+        except:
+            topics = []
+
+        if failed:
+            status.text('Topic modelling failed, it is tried again when the page is reloaded')
+
+        elif not topics:
+            status.text("Couldn't find any topics in this chat")
+
+        else:
+            status.empty()
+
+        for idx, png in enumerate(topics):
+            try:
+                st.subheader(f'Topic {idx+1}')
+                st.image(png, use_column_width=True)
+
+            except:
+                st.text("")
 
 if __name__ == '__main__':
-	main()
+	main()
\ No newline at end of file
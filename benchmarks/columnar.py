@@ -0,0 +1,76 @@
+"""
+Time and peak memory of reopening a parsed chat, from the csv of txt_to_csv
+with dates parsed and date features added again, against the memory mapped feather cache
+
+usage: python -m benchmarks.columnar [--messages 5000000]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.parser import peak_rss_mb
+from benchmarks.synthetic import generate_export
+from utils.columnar import read_frames, write_frames
+from utils.preprocessing import add_datepart, preprocess
+
+
+def reopen_csv(path):
+    df = pd.read_csv(os.path.join(path, 'chat.csv'), parse_dates=['datetime'])
+    return add_datepart(df, 'datetime')
+
+
+def reopen_feather(path):
+    return read_frames(os.path.join(path, 'frames'))[1]
+
+
+def prepare(path, num_messages, num_members):
+    fn = os.path.join(path, 'chat.txt')
+    generate_export(fn, num_messages, num_members)
+
+    chats, chats_with_features = preprocess(fn)
+    chats.reset_index()[['datetime', 'id', 'message']].to_csv(os.path.join(path, 'chat.csv'), index=False)
+    write_frames(chats, chats_with_features, os.path.join(path, 'frames'))
+
+
+def _run(name, path, queue):
+    reopen = {'csv': reopen_csv, 'feather': reopen_feather}[name]
+    start = time.perf_counter()
+    df = reopen(path)
+    queue.put((name, time.perf_counter() - start, peak_rss_mb(), len(df)))
+
+
+def measure(name, path):
+    # every format is read in a fresh process so peak rss is not shared
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(name, path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=5_000_000)
+    parser.add_argument('--members', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # linux keeps peak rss across fork and exec, so this process stays small
+        proc = mp.get_context('spawn').Process(target=prepare, args=(tmp, args.messages, args.members))
+        proc.start()
+        proc.join()
+
+        print(f'{args.messages:,} messages')
+        for name in ('csv', 'feather'):
+            name, seconds, rss, rows = measure(name, tmp)
+            print(f'{name:>10}: {seconds:8.2f} s  peak rss {rss:8.1f} MB  rows {rows:,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Peak memory of building the frames of preprocess from a parsed chat,
+the original copies with int64 and string date features against build_frames
+
+usage: python -m benchmarks.datepart [--messages 5000000]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import re
+import tempfile
+import time
+
+from benchmarks.parser import peak_rss_mb, rss_mb
+from benchmarks.synthetic import generate_export
+from utils.features import add_message_features
+from utils.preprocessing import build_frames, parse_chat
+
+
+def legacy_add_datepart(df, fieldname):
+    """
+    add_datepart before compact dtypes, copies df
+    """
+    new_df = df.copy()
+    field = df[fieldname]
+    target_prefix = re.sub('[Dd]atetime$', '', fieldname)
+
+    for name in ('hour', 'minute', 'Year', 'Month', 'Day', 'Dayofweek', 'Dayofyear'):
+        new_df[target_prefix+name] = getattr(field.dt, name.lower())
+
+    # dt.week is gone from pandas 2, isocalendar gives the same weeks
+    new_df[target_prefix+'Week'] = field.dt.isocalendar().week.astype('int64')
+
+    new_df[target_prefix+'Elapsed'] = (field - field.min()).dt.days
+    new_df[target_prefix+'MonthName'] = field.dt.month_name()
+    new_df[target_prefix+'DayName'] = field.dt.day_name()
+    new_df.drop(fieldname, axis=1, inplace=True)
+    return new_df
+
+
+def legacy_build_frames(chats_df):
+    chats = chats_df.set_index('datetime')
+    chats_with_features = legacy_add_datepart(chats_df, 'datetime')
+    return chats, chats_with_features
+
+
+def _run(name, fn, queue):
+    build = {'legacy': legacy_build_frames, 'build_frames': build_frames}[name]
+    chats_df = add_message_features(parse_chat(fn))
+    before = rss_mb()
+
+    start = time.perf_counter()
+    frames = build(chats_df)
+    seconds = time.perf_counter() - start
+
+    del chats_df
+    queue.put((name, seconds, before, peak_rss_mb(), rss_mb(), len(frames[1])))
+
+
+def measure(name, fn):
+    # every builder runs in a fresh process so peak rss is not shared
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(name, fn, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=5_000_000)
+    parser.add_argument('--members', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        generate_export(fn, args.messages, args.members)
+
+        print(f'{args.messages:,} messages, rss in MB')
+        for name in ('legacy', 'build_frames'):
+            name, seconds, before, peak, after, rows = measure(name, fn)
+            print(f'{name:>12}: {seconds:6.2f} s  parsed {before:8.1f}  peak {peak:8.1f}  '
+                  f'frames kept {after:8.1f}  rows {rows:,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Microbenchmark of fetch_stats against the original per-message loop
+
+usage: python -m benchmarks.fetch_stats [--messages 100000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_export
+from utils.features import count_urls, urlextractor
+from utils.helpers import fetch_stats
+from utils.preprocessing import preprocess
+
+
+def legacy_fetch_stats(df, user):
+    """
+    fetch_stats before the per-message columns, word counts are character counts
+    """
+    if user.lower() != 'overall':
+        df = df[df.id == user]
+
+    words = []
+    urls = []
+    for message in df.message:
+        words.extend(message)
+        urls.extend(urlextractor.find_urls(message))
+
+    num_medias = df[df.message == '<Media omitted>'].shape[0]
+    return df.message.shape[0], len(words), num_medias, len(urls)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--members', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        generate_export(fn, args.messages, args.members)
+        _, chats = preprocess(fn)
+
+    user = chats.id.cat.categories[0]
+    texts = chats.message[~(chats.is_media | chats.is_deleted)]
+
+    rows = [
+        ('legacy loop, overall', *timed(legacy_fetch_stats, chats, 'Overall')),
+        ('legacy loop, one user', *timed(legacy_fetch_stats, chats, user)),
+        ('word counts, once per chat', *timed(lambda: int(texts.str.count(r'\S+').sum()))),
+        ('url counts, once per chat', *timed(lambda: int(count_urls(texts).sum()))),
+        ('fetch_stats, overall', *timed(fetch_stats, chats, 'Overall')),
+        ('fetch_stats, one user', *timed(fetch_stats, chats, user)),
+    ]
+
+    print(f'{len(chats):,} messages')
+    for name, seconds, result in rows:
+        print(f'{name:>28}: {seconds * 1000:10.2f} ms  {result}')
+
+
+if __name__ == '__main__':
+    main()
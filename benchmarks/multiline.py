@@ -0,0 +1,44 @@
+"""
+Check correctness and throughput of multi-line message parsing
+on exports where many messages are long code pastes
+
+usage: python -m benchmarks.multiline [--messages 1000000] [--multiline-rate 0.2]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_export
+from utils.preprocessing import parse_chat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--multiline-rate', type=float, default=0.2)
+    parser.add_argument('--max-paste-lines', type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        expected = generate_export(fn, args.messages, args.members,
+                                   args.multiline_rate, args.max_paste_lines)
+        size = os.path.getsize(fn) / 1024 ** 2
+        print(f"synthetic export: {expected['messages']:,} messages, "
+              f"{expected['lines']:,} lines, {expected['multiline']:,} multi-line, {size:.1f} MB")
+
+        for multiline in (False, True):
+            start = time.perf_counter()
+            df = parse_chat(fn, multiline=multiline)
+            seconds = time.perf_counter() - start
+
+            lines = int(df.message.str.count('\n').sum()) + len(df)
+            correct = (len(df) == expected['messages'] and lines == expected['lines'])
+            print(f"multiline={multiline!s:>5}: {seconds:6.2f} s  {size / seconds:6.1f} MB/s  "
+                  f"messages {len(df):,}  lines {lines:,}  {'ok' if correct else 'MISMATCH'}")
+
+
+if __name__ == '__main__':
+    main()
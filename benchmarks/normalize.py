@@ -0,0 +1,55 @@
+"""
+Throughput of the topic modelling text normalization,
+preprocess_text per message against the batched normalize_texts
+
+usage: python -m benchmarks.normalize [--messages 200000] [--processes 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_export
+from utils.normalize import normalize_texts, normalize_word, preprocess_text
+from utils.preprocessing import parse_chat
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        generate_export(fn, args.messages)
+        messages = parse_chat(fn).message.tolist()
+
+    # warm up the lemmatizer, wordnet is loaded lazily on first use
+    preprocess_text('warming up')
+    normalize_word.cache_clear()
+
+    rows = [
+        ('preprocess_text', *timed(lambda: [preprocess_text(message) for message in messages])),
+        ('normalize_texts', *timed(normalize_texts, messages)),
+    ]
+    normalize_word.cache_clear()
+    if args.processes > 1:
+        rows.append((f'normalize_texts, {args.processes} processes',
+                     *timed(normalize_texts, messages, processes=args.processes)))
+
+    print(f'{len(messages):,} messages')
+    expected = rows[0][2]
+    for name, seconds, result in rows:
+        print(f'{name:>32}: {seconds:8.2f} s  {len(messages) / seconds:12,.0f} messages/s  '
+              f'{"same" if result == expected else "DIFFERENT"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare peak memory and wall time of the streaming parser
+against the original txt -> csv -> read_csv path
+
+usage: python -m benchmarks.parser [--lines 5000000]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_export
+from utils.preprocessing import parse_chat, txt_to_csv
+
+
+def legacy_parse(fn):
+    txt_to_csv(fn)
+    return pd.read_csv(f'{fn[:-4]}.csv', parse_dates=['datetime'])
+
+
+def streaming_parse(fn):
+    with open(fn, 'rb') as f:
+        return parse_chat(f)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def rss_mb():
+    # resident set size now, linux only
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+def _run(name, fn, queue):
+    parser = {'legacy': legacy_parse, 'streaming': streaming_parse}[name]
+    start = time.perf_counter()
+    df = parser(fn)
+    queue.put((name, time.perf_counter() - start, peak_rss_mb(), len(df)))
+
+
+def measure(name, fn):
+    # every parser runs in a fresh process so peak rss is not shared
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(name, fn, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=5_000_000)
+    parser.add_argument('--members', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        generate_export(fn, args.lines, args.members)
+        size = os.path.getsize(fn) / 1024 ** 2
+        print(f'synthetic export: {args.lines:,} lines, {size:.1f} MB')
+
+        for name in ('legacy', 'streaming'):
+            name, seconds, rss, rows = measure(name, fn)
+            print(f'{name:>10}: {seconds:8.2f} s  peak rss {rss:8.1f} MB  rows {rows:,}')
+
+
+if __name__ == '__main__':
+    main()
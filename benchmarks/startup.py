@@ -0,0 +1,83 @@
+"""
+Cold start of the app: time to import app.py in a fresh interpreter, and the heavy
+modules it loads, of this tree against an earlier revision of the repository
+
+usage: python -m benchmarks.startup [--baseline HEAD~1] [--repeat 5]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+# dependencies that should only be imported by the sections that use them
+HEAVY_MODULES = ['top2vec', 'tensorflow', 'gensim', 'umap', 'hdbscan', 'nltk', 'wordcloud',
+                 'plotly', 'seaborn', 'matplotlib', 'altair', 'scipy']
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_app(path, timeout):
+    """
+    Seconds to import app.py of the tree at path, and the heavy modules loaded,
+    app.py renders nothing outside of streamlit run, only its imports run
+    """
+    proc = subprocess.run([sys.executable, '-c', PROBE], cwd=path, capture_output=True, text=True,
+                          timeout=timeout)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(path, repeat, timeout):
+    runs = [import_app(path, timeout) for _ in range(repeat)]
+    return statistics.median(run['seconds'] for run in runs), runs[0]['modules']
+
+
+def checkout(revision, path):
+    """
+    Extract the files of revision into directory path
+    """
+    archive = subprocess.run(['git', 'archive', '--format=tar', revision], cwd=ROOT,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help='git revision to compare against, such as HEAD~1')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=300, help='seconds allowed for each import')
+    args = parser.parse_args()
+
+    trees = [('this tree', ROOT)]
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.baseline:
+            checkout(args.baseline, tmp)
+            trees.insert(0, (args.baseline, tmp))
+
+        print(f'import app, median of {args.repeat}')
+        for name, path in trees:
+            try:
+                seconds, modules = measure(path, args.repeat, args.timeout)
+                print(f'{name:>12}: {seconds:6.2f} s  loads {", ".join(modules) or "none of them"}')
+            except (RuntimeError, subprocess.TimeoutExpired) as exc:
+                print(f'{name:>12}: failed, {exc}')
+
+
+if __name__ == '__main__':
+    main()
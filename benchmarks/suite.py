@@ -0,0 +1,178 @@
+"""
+Time and peak memory of preprocess, every chart and stat of utils.helpers, and get_topics
+on synthetic exports of growing size, written to a json file to compare runs
+
+usage: python -m benchmarks.suite [--sizes 10000 100000 1000000 5000000] [--out benchmark.json]
+                                  [--targets preprocess get_timelines ...] [--baseline old.json]
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.parser import peak_rss_mb, rss_mb
+from benchmarks.synthetic import generate_export
+
+# frame each target is called with, named as in app.py, and its arguments after the frame,
+# preprocess reads the export itself
+TARGETS = {
+    'preprocess': (None, ()),
+    'fetch_messages': ('chats', ('Overall',)),
+    'fetch_stats': ('chats', ('Overall',)),
+    'fetch_active_users': ('chats', ()),
+    'timeline_stats': ('chats', ('Overall',)),
+    'get_activity_map': ('chats', ('Overall',)),
+    'get_wordcloud': ('chats', ('Overall',)),
+    'wordcloud_image': ('chats', ('Overall',)),
+    'most_common_emojis': ('chats', ('Overall',)),
+    'get_timelines': ('chats_with_date', ('Overall',)),
+    'conversation_stats': ('chats', ('Overall',)),
+    'get_reply_map': ('chats', ('Overall',)),
+    'get_response_times': ('chats', ()),
+    'get_topics': ('chats', ()),
+}
+
+# shares of messages in the exports, roughly those of data/group_chats.csv
+RATES = {'multiline_rate': 0.01, 'emoji_rate': 0.1, 'media_rate': 0.08, 'deleted_rate': 0.01}
+
+
+def prepare(path, num_messages, num_members, fmt):
+    from utils.columnar import write_frames
+    from utils.preprocessing import preprocess
+
+    fn = os.path.join(path, 'chat.txt')
+    generate_export(fn, num_messages, num_members, fmt=fmt, **RATES)
+
+    # targets other than preprocess start from the memory mapped frames, as the app does on a cache hit
+    chats_with_date, chats = preprocess(fn)
+    write_frames(chats_with_date, chats, os.path.join(path, 'frames'))
+
+
+def _run(target, path, results):
+    try:
+        frame, args = TARGETS[target]
+        if frame is None:
+            from utils.preprocessing import preprocess
+            function, args = preprocess, (os.path.join(path, 'chat.txt'),)
+
+        else:
+            from utils import helpers, topic_model
+            from utils.columnar import read_frames
+            frames = dict(zip(('chats_with_date', 'chats'), read_frames(os.path.join(path, 'frames'))))
+            function = getattr(helpers, target, None) or getattr(topic_model, target)
+            args = (frames[frame],) + args
+
+        before = rss_mb()
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        results.put({'seconds': seconds, 'rss_before_mb': before, 'peak_rss_mb': peak_rss_mb()})
+
+    except Exception as exc:
+        results.put({'error': f'{type(exc).__name__}: {exc}'})
+
+
+def measure(target, path, timeout):
+    # every target runs in a fresh process so peak rss is not shared
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(target, path, results))
+    proc.start()
+    try:
+        result = results.get(timeout=timeout)
+    except queue.Empty:
+        proc.terminate()
+        result = {'error': f'timed out after {timeout} s'}
+    proc.join()
+    return result
+
+
+def environment():
+    """
+    Versions and machine the results were measured on
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline):
+    """
+    Print time and peak memory of results against those of the same size and target in baseline
+    """
+    with open(baseline) as f:
+        before = {(row['messages'], row['target']): row for row in json.load(f)['results']}
+
+    print(f'\nagainst {baseline}')
+    for row in results:
+        old = before.get((row['messages'], row['target']))
+        if old is None or 'error' in old or 'error' in row:
+            continue
+        print(f'{row["messages"]:>10,} {row["target"]:>20}: time x{row["seconds"] / old["seconds"]:5.2f}  '
+              f'peak rss x{row["peak_rss_mb"] / old["peak_rss_mb"]:5.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--format', default='android', help='export format of benchmarks.synthetic.FORMATS')
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds allowed for each target and size')
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--baseline', help='json file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            # topics are learnt again for every size rather than read from the topic cache
+            os.environ['TOPIC_CACHE_DIR'] = os.path.join(tmp, 'topics')
+
+            # linux keeps peak rss across fork and exec, so this process stays small
+            proc = mp.get_context('spawn').Process(target=prepare, args=(tmp, size, args.members, args.format))
+            proc.start()
+            proc.join()
+
+            for target in args.targets:
+                row = {'messages': size, 'target': target, **measure(target, tmp, args.timeout)}
+                results.append(row)
+
+                if 'error' in row:
+                    print(f'{size:>10,} {target:>20}: {row["error"]}')
+                else:
+                    print(f'{size:>10,} {target:>20}: {row["seconds"]:8.3f} s  '
+                          f'rss before {row["rss_before_mb"]:8.1f} MB  peak {row["peak_rss_mb"]:8.1f} MB')
+
+            # written after every size, so an interrupted run keeps the sizes it finished
+            with open(args.out, 'w') as f:
+                json.dump({'environment': environment(), 'settings': {**vars(args), **RATES},
+                           'results': results}, f, indent=2)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
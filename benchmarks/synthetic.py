@@ -0,0 +1,103 @@
+import random
+from datetime import datetime, timedelta
+
+WORDS = (
+    'hi hello ok assignment deadline submit model training data loss accuracy '
+    'please help anyone completed notebook link lecture video doubt session '
+    'tomorrow today thanks sure yes no maybe code error python pandas numpy '
+    'https://colab.research.google.com/drive/1a2b3c github.com/gborn/Whatsapp_Chat_Analysis'
+).split()
+
+CODE = [
+    'import numpy as np',
+    'def train(model, data):',
+    '    for x, y in data:',
+    '        loss = model.fit(x, y)',
+    '    return loss',
+    '',
+    'print(f"accuracy: {acc:.2f}")',
+    '    # TODO: check shapes',
+]
+
+# single and multi code point emojis, as found in real chats
+EMOJIS = ['😂', '👍', '🙏', '🔥', '😊', '🎉', '😭', '🤔', '❤️', '👍🏽', '🇮🇳', '👨‍💻']
+
+# placeholders of attachments and deleted messages, as written by each app
+MEDIA = {'android': '<Media omitted>', 'ios': '‎image omitted'}
+DELETED = {'android': 'This message was deleted', 'ios': '‎This message was deleted'}
+
+
+def _android(ts):
+    return f'{ts.day}/{ts.month:02d}/{ts.year}, {ts.hour:02d}:{ts.minute:02d} - '
+
+
+def _ios(ts):
+    return f'[{ts.day:02d}/{ts.month:02d}/{ts.year}, {ts.hour:02d}:{ts.minute:02d}:{ts.second:02d}] '
+
+
+def _us(ts):
+    hour = ts.hour % 12 or 12
+    return f'{ts.month}/{ts.day}/{ts.year % 100:02d}, {hour}:{ts.minute:02d} {"AM" if ts.hour < 12 else "PM"} - '
+
+
+def _iso(ts):
+    return f'{ts.year}-{ts.month:02d}-{ts.day:02d}, {ts.hour:02d}:{ts.minute:02d} - '
+
+
+# timestamp prefix of a message in each export format, and which app writes it
+FORMATS = {
+    'android': (_android, 'android'),    # d/mm/yyyy, hh:mm - name: text
+    'ios': (_ios, 'ios'),                # [dd/mm/yyyy, hh:mm:ss] name: text
+    'us': (_us, 'android'),              # m/d/yy, h:mm AM - name: text
+    'iso': (_iso, 'android'),            # yyyy-mm-dd, hh:mm - name: text
+}
+
+
+def generate_export(fn, num_messages, num_members=50, multiline_rate=0.0, max_paste_lines=40, seed=0,
+                    fmt='android', emoji_rate=0.0, media_rate=0.0, deleted_rate=0.0, start=datetime(2019, 1, 1)):
+    """
+    Write a synthetic exported whatsapp chat with num_messages messages
+    in export format fmt, one of FORMATS, by default android's "d/m/yyyy, hh:mm - name: text",
+    multiline_rate of the messages are code pastes of up to max_paste_lines lines,
+    emoji_rate of the text messages end with up to three emojis,
+    media_rate and deleted_rate of the messages are attachments and deleted messages,
+    start: time of the first message, exports with month first dates are only told apart
+    from day first ones by the parser when the first days sent have a day above 12
+    Returns counts of messages, lines, and multi-line, media, deleted messages, and emojis written
+    """
+    rng = random.Random(seed)
+    members = [f'Member{idx}' for idx in range(num_members)]
+    prefix, app = FORMATS[fmt]
+    timestamp = start
+    num_lines = num_multiline = num_media = num_deleted = num_emojis = 0
+
+    with open(fn, 'w', encoding='utf-8') as f:
+        for _ in range(num_messages):
+            timestamp += timedelta(seconds=rng.randint(0, 600))
+            text = ' '.join(rng.choices(WORDS, k=rng.randint(1, 12)))
+
+            # the default export draws no more random numbers, so it stays the same for every seed
+            kind = rng.random() if media_rate or deleted_rate else 1.0
+            if kind < media_rate:
+                text = MEDIA[app]
+                num_media += 1
+
+            elif kind < media_rate + deleted_rate:
+                text = DELETED[app]
+                num_deleted += 1
+
+            else:
+                if rng.random() < multiline_rate:
+                    text += ':\n' + '\n'.join(rng.choices(CODE, k=rng.randint(1, max_paste_lines)))
+                    num_multiline += 1
+
+                if emoji_rate and rng.random() < emoji_rate:
+                    emojis = rng.choices(EMOJIS, k=rng.randint(1, 3))
+                    text += ' ' + ''.join(emojis)
+                    num_emojis += len(emojis)
+
+            f.write(f'{prefix(timestamp)}{rng.choice(members)}: {text}\n')
+            num_lines += text.count('\n') + 1
+
+    return {'messages': num_messages, 'lines': num_lines, 'multiline': num_multiline,
+            'media': num_media, 'deleted': num_deleted, 'emojis': num_emojis}
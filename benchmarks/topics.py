@@ -0,0 +1,99 @@
+"""
+Time, peak memory, and topic words of each topic engine, Top2Vec on every message against
+TF-IDF and NMF of distinct conversation windows, on a synthetic export or a real one
+
+usage: python -m benchmarks.topics [--messages 100000] [--export chat.txt] [--engines top2vec nmf]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+
+from benchmarks.parser import peak_rss_mb, rss_mb
+from benchmarks.synthetic import generate_export
+from benchmarks.suite import RATES
+
+
+def _run(engine, fn, results):
+    try:
+        from utils.preprocessing import preprocess
+        from utils.topic_model import find_topic_words, topic_messages
+
+        chats_with_date, chats = preprocess(fn)
+        before = rss_mb()
+        start = time.perf_counter()
+        topic_words = find_topic_words(topic_messages(chats, engine), engine)
+        seconds = time.perf_counter() - start
+        results.put({'seconds': seconds, 'rss_before_mb': before, 'peak_rss_mb': peak_rss_mb(),
+                     'topics': topic_words})
+
+    except Exception as exc:
+        results.put({'error': f'{type(exc).__name__}: {exc}'})
+
+
+def measure(engine, fn, timeout):
+    # every engine runs in a fresh process so peak rss is not shared
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(engine, fn, results))
+    proc.start()
+    try:
+        result = results.get(timeout=timeout)
+    except queue.Empty:
+        proc.terminate()
+        result = {'error': f'timed out after {timeout} s'}
+    proc.join()
+    return result
+
+
+def overlap(topics, others):
+    """
+    Jaccard similarity of the words of each topic and the most similar topic among others
+    """
+    return [max((len(set(words) & set(other)) / len(set(words) | set(other)) for other in others), default=0)
+            for words in topics]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--export', help='exported chat to learn topics of, instead of a synthetic one')
+    parser.add_argument('--engines', nargs='+', default=['top2vec', 'nmf'])
+    parser.add_argument('--words', type=int, default=10, help='topic words printed')
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds allowed for each engine')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # topics are learnt by every run rather than read from the topic cache
+        os.environ['TOPIC_CACHE_DIR'] = os.path.join(tmp, 'topics')
+
+        fn = args.export
+        if fn is None:
+            fn = os.path.join(tmp, 'chat.txt')
+            generate_export(fn, args.messages, args.members, **RATES)
+
+        results = {}
+        for engine in args.engines:
+            result = results[engine] = measure(engine, fn, args.timeout)
+            if 'error' in result:
+                print(f'{engine:>8}: {result["error"]}')
+                continue
+
+            print(f'{engine:>8}: {result["seconds"]:8.2f} s  rss before {result["rss_before_mb"]:8.1f} MB  '
+                  f'peak {result["peak_rss_mb"]:8.1f} MB  {len(result["topics"])} topics')
+            for idx, words in enumerate(result['topics']):
+                print(f'{"":>10}topic {idx + 1}: {" ".join(words[:args.words])}')
+
+    learnt = {engine: result['topics'] for engine, result in results.items() if 'error' not in result}
+    for engine, topics in learnt.items():
+        for other, other_topics in learnt.items():
+            if other != engine and topics:
+                similarity = ', '.join(f'{value:.2f}' for value in overlap(topics, other_topics))
+                print(f'{engine:>8}: words shared with the closest {other} topic {similarity}')
+
+
+if __name__ == '__main__':
+    main()
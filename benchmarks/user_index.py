@@ -0,0 +1,57 @@
+"""
+Per-selection latency of taking a user's messages with a boolean scan
+of the id column against the user index built by preprocess
+
+usage: python -m benchmarks.user_index [--messages 2000000] [--members 500]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_export
+from utils.indexing import select_user
+from utils.preprocessing import preprocess
+
+
+def timeit(fn, users, repeat=3):
+    """
+    Best of repeat runs of the mean time of fn over users, in milliseconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for user in users:
+            fn(user)
+        best = min(best, (time.perf_counter() - start) / len(users))
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--selections', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        generate_export(fn, args.messages, args.members)
+        _, chats = preprocess(fn)
+
+    users = random.Random(0).choices(chats.id.cat.categories.tolist(), k=args.selections)
+    ids = chats.id.astype(object)
+
+    print(f'{len(chats):,} messages, {chats.id.nunique()} members, {args.selections} selections')
+    results = {
+        'boolean scan, object id': timeit(lambda user: chats[ids == user], users),
+        'boolean scan, categorical id': timeit(lambda user: chats[chats.id == user], users),
+        'user index': timeit(lambda user: select_user(chats, user), users),
+    }
+    for name, ms in results.items():
+        print(f'{name:>30}: {ms:8.3f} ms per selection')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Time and peak memory of parsing a large zipped export with media files, streamed from
+the upload's buffer, against extracting the archive to disk first, and a plain text export
+
+usage: python -m benchmarks.zipped [--messages 2000000] [--media 200] [--media-size 1000000]
+"""
+import argparse
+import io
+import multiprocessing as mp
+import os
+import tempfile
+import time
+import zipfile
+
+from benchmarks.parser import peak_rss_mb, rss_mb
+from benchmarks.synthetic import generate_export
+from utils.preprocessing import find_chat_member, parse_chat
+
+CHAT_NAME = 'WhatsApp Chat with Benchmark.txt'
+
+
+def make_zip(path, fn, num_media, media_size):
+    """
+    Zipped export of chat fn with num_media media files, stored as the app stores photos
+    """
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.write(fn, CHAT_NAME, compress_type=zipfile.ZIP_DEFLATED)
+        for idx in range(num_media):
+            archive.writestr(f'IMG-20190101-WA{idx:04d}.jpg', os.urandom(media_size))
+
+
+def extracted(data, tmp):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        archive.extractall(tmp)
+        return parse_chat(os.path.join(tmp, find_chat_member(archive).filename))
+
+
+def written_mb():
+    # bytes written by this process so far, linux only
+    with open('/proc/self/io') as f:
+        counters = dict(line.split(': ') for line in f.read().splitlines())
+    return int(counters['wchar']) / 1024 ** 2
+
+
+def _run(name, path, queue):
+    # the upload is held in memory as streamlit does, before parsing starts
+    with open(path, 'rb') as f:
+        data = f.read()
+    before, written = rss_mb(), written_mb()
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        df = extracted(data, tmp) if name == 'zip extracted' else parse_chat(io.BytesIO(data))
+    queue.put((name, time.perf_counter() - start, before, peak_rss_mb(), written_mb() - written, len(df)))
+
+
+def measure(name, path):
+    # every path runs in a fresh process so peak rss is not shared
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(name, path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--media', type=int, default=200)
+    parser.add_argument('--media-size', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'chat.txt')
+        generate_export(fn, args.messages, args.members, emoji_rate=0.1, media_rate=0.05)
+        zipped = os.path.join(tmp, 'chat.zip')
+        make_zip(zipped, fn, args.media, args.media_size)
+
+        print(f'{args.messages:,} messages, chat {os.path.getsize(fn) / 1024 ** 2:.0f} MB, '
+              f'zip with {args.media} media files {os.path.getsize(zipped) / 1024 ** 2:.0f} MB')
+        for name, path in (('text', fn), ('zip extracted', zipped), ('zip streamed', zipped)):
+            name, seconds, before, peak, written, rows = measure(name, path)
+            print(f'{name:>14}: {seconds:6.2f} s  rss with upload {before:8.1f} MB  peak {peak:8.1f} MB  '
+                  f'written {written:8.1f} MB  rows {rows:,}')
+
+
+if __name__ == '__main__':
+    main()
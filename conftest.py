@@ -0,0 +1 @@
+# puts the repository root on sys.path, so tests import utils as the app does
@@ -0,0 +1,7 @@
+from utils.batch import results_names
+
+
+def test_results_names_are_unique():
+    names = results_names(['a/chat.txt', 'b/chat.txt', 'c/chat-2.txt', 'd/summary.txt', 'e/Chat.txt'])
+
+    assert names == ['chat.parquet', 'chat-2.parquet', 'chat-2-2.parquet', 'summary-2.parquet', 'Chat-3.parquet']
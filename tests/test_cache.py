@@ -0,0 +1,47 @@
+import os
+import threading
+
+from utils.cache import DiskCache
+
+
+def write_directory(text):
+    def write(path):
+        os.makedirs(path)
+        with open(os.path.join(path, 'entry.txt'), 'w') as f:
+            f.write(text)
+
+    return write
+
+
+def test_put_keeps_the_entry_completed_first(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 20)
+
+    first = cache.put('key', write_directory('first'))
+    second = cache.put('key', write_directory('second'))
+
+    assert first == second == cache.get('key')
+    with open(os.path.join(second, 'entry.txt')) as f:
+        assert f.read() == 'first'
+    assert os.listdir(str(tmp_path)) == ['key']
+
+
+def test_concurrent_puts_into_a_full_cache(tmp_path):
+    cache = DiskCache(str(tmp_path), 1024)
+    errors = []
+
+    def put_entries(worker):
+        for idx in range(60):
+            try:
+                path = cache.put(f'{worker}-{idx}', write_directory('x' * 600))
+                assert path == cache.path(f'{worker}-{idx}')
+            except Exception as exc:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=put_entries, args=(worker,)) for worker in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith('.tmp-')]
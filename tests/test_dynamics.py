@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from utils.dynamics import SESSION_IDLE, Conversations
+
+
+def chat_frame(seed=3, messages=500):
+    """
+    Messages of five members with gaps from seconds to days, not in time order
+    """
+    rng = np.random.default_rng(seed)
+    seconds = np.cumsum(rng.exponential(1500, messages)).astype(np.int64)
+    datetimes = pd.Timestamp('2021-03-01') + pd.to_timedelta(seconds, unit='s')
+    df = pd.DataFrame({'id': pd.Categorical([f'Member{user}' for user in rng.integers(0, 5, messages)])},
+                      index=pd.DatetimeIndex(datetimes, name='datetime'))
+    return df.iloc[rng.permutation(messages)]
+
+
+def sessions_by_loop(df):
+    """
+    Sessions as lists of senders, and replies as pairs of replier and replied to, one message at a time
+    """
+    df = df.sort_index(kind='mergesort')
+    sessions, replies, previous = [], [], None
+    for sent, user in zip(df.index, df['id']):
+        if previous is None or sent - previous[0] > SESSION_IDLE:
+            sessions.append({'start': sent, 'end': sent, 'users': []})
+        elif user != previous[1]:
+            replies.append((user, previous[1]))
+
+        sessions[-1]['end'] = sent
+        sessions[-1]['users'].append(user)
+        previous = (sent, user)
+
+    return sessions, replies
+
+
+def test_sessions_and_replies_match_a_loop():
+    df = chat_frame()
+    sessions, replies = sessions_by_loop(df)
+    chat = Conversations(df)
+
+    table = chat.session_table()
+    assert table['start'].tolist() == [session['start'] for session in sessions]
+    assert table['messages'].tolist() == [len(session['users']) for session in sessions]
+    assert table['members'].tolist() == [len(set(session['users'])) for session in sessions]
+    assert np.allclose(table['minutes'], [(session['end'] - session['start']).total_seconds() / 60
+                                          for session in sessions])
+
+    matrix = chat.reply_matrix().toarray()
+    users = list(chat.users)
+    expected = np.zeros_like(matrix)
+    for user, replied in replies:
+        expected[users.index(user), users.index(replied)] += 1
+    assert (matrix == expected).all()
+
+
+def test_conversations_of_an_empty_chat():
+    chat = Conversations(chat_frame().iloc[:0])
+
+    assert len(chat.session_table()) == 0
+    assert chat.reply_matrix().nnz == 0
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import helpers
+from utils.aggregation import activity_matrix
+from utils.indexing import select_window, time_index
+from utils.preprocessing import preprocess
+
+MESSAGES = ['good morning', '<Media omitted>', 'notes at https://example.com', 'This message was deleted',
+            'see you at the lab', 'ok']
+
+WINDOWS = [
+    (date(2021, 1, 1), date(2021, 12, 31)),
+    (date(2021, 2, 3), date(2021, 2, 3)),
+    (date(2021, 2, 10), date(2021, 4, 22)),
+    (date(2021, 5, 20), date(2021, 7, 1)),
+    (date(2022, 1, 1), date(2022, 1, 5)),
+]
+
+
+@pytest.fixture(scope='module')
+def frames(tmp_path_factory):
+    """
+    Frames of an export of irregularly spaced messages, written out of order
+    """
+    rng = np.random.default_rng(7)
+    minutes = np.cumsum(rng.exponential(180, 2000)).astype(np.int64)
+    lines = []
+    for idx, minute in enumerate(minutes):
+        sent = datetime(2021, 2, 1, 6, 0) + timedelta(minutes=int(minute))
+        member = rng.integers(0, 6)
+        lines.append(f'{sent:%d/%m/%Y, %H:%M} - Member{member}: {MESSAGES[idx % len(MESSAGES)]}')
+
+    # a few messages are exported late, as messages of a phone that was offline are
+    lines[100], lines[900] = lines[900], lines[100]
+
+    fn = tmp_path_factory.mktemp('export') / 'chat.txt'
+    fn.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return preprocess(str(fn))
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+@pytest.mark.parametrize('user', ['Overall', 'Member2', 'Nobody'])
+def test_window_answers_match_the_filtered_frame(frames, window, user):
+    chats, chats_with_features = frames
+    selected = select_window(chats_with_features, window)
+    start, end = pd.Timestamp(window[0]), pd.Timestamp(window[1]) + pd.Timedelta('1D')
+    expected = chats_with_features[(chats_with_features.index >= start) & (chats_with_features.index < end)]
+
+    assert selected.index.sort_values().equals(expected.index.sort_values())
+    assert helpers.fetch_stats(chats, user, window) == helpers.fetch_stats(expected, user)
+
+    rows = expected if user == 'Overall' else expected[expected.id == user]
+    assert (time_index(chats).activity_matrix(user, *window)
+            == activity_matrix(rows.index.dayofweek, rows.index.hour)).all()
+
+    # first and last messages are those in time order, not in the order of the export
+    text = rows[~(rows.is_media | rows.is_deleted)]
+    if len(text):
+        in_order = expected.sort_index(kind='mergesort')
+        assert helpers.timeline_stats(chats_with_features, user, window) == helpers.timeline_stats(in_order, user)
+    else:
+        assert helpers.timeline_stats(chats_with_features, user, window) == (0, '-', '-')
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.preprocessing import SNIFF_SIZE, add_datepart, date_feature, parse_chat
+
+
+def write_us_export(path, start, days, messages_per_day):
+    """
+    Month first export with 12 hour times, as exported by phones set to the US locale
+    """
+    lines = []
+    for day in range(days):
+        date = start + timedelta(days=day)
+        for idx in range(messages_per_day):
+            minute = idx % 60
+            lines.append(f'{date.month}/{date.day}/{date:%y}, 9:{minute:02d} AM - Member{idx % 5}: message {idx}')
+
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def test_month_first_export_reaching_day_13_after_the_sample(tmp_path):
+    fn = tmp_path / 'chat.txt'
+    write_us_export(fn, datetime(2019, 1, 1), days=20, messages_per_day=100)
+    assert fn.read_text().find('1/13/19') > SNIFF_SIZE
+
+    df = parse_chat(str(fn))
+
+    assert len(df) == 2000
+    assert df['datetime'].min() == pd.Timestamp('2019-01-01 09:00')
+    assert df['datetime'].max() == pd.Timestamp('2019-01-20 09:59')
+
+
+def test_month_first_export_never_reaching_day_13(tmp_path):
+    fn = tmp_path / 'chat.txt'
+    write_us_export(fn, datetime(2019, 1, 1), days=7, messages_per_day=10)
+
+    df = parse_chat(str(fn))
+
+    assert df['datetime'].dt.month.unique().tolist() == [1]
+    assert df['datetime'].dt.day.unique().tolist() == list(range(1, 8))
+
+
+def test_date_features_of_microsecond_datetimes():
+    datetimes = pd.Series(pd.to_datetime(['2019-12-30 23:59:30', '2020-01-01 08:05:00', '2020-01-03 17:45:00']))
+    df = pd.DataFrame({'datetime': datetimes.astype('datetime64[us]')})
+
+    features = add_datepart(df.copy(), 'datetime')
+
+    assert features['hour'].tolist() == [23, 8, 17]
+    assert features['Year'].tolist() == [2019, 2020, 2020]
+    assert features['Elapsed'].tolist() == [0, 1, 3]
+    assert date_feature(df.set_index('datetime'), 'minute').tolist() == [59, 5, 45]
+    assert date_feature(df.set_index('datetime'), 'Week').tolist() == [1, 1, 1]
@@ -0,0 +1,42 @@
+import tracemalloc
+
+import pytest
+
+from utils import profiling
+from utils.profiling import collect, profiled
+
+MB = 1024 ** 2
+
+
+@profiled
+def inner():
+    block = bytearray(10 * MB)
+    del block
+
+
+@profiled
+def outer():
+    # the first block is held across the inner call, and freed before the second one
+    block = bytearray(40 * MB)
+    inner()
+    del block
+    block = bytearray(40 * MB)
+    del block
+
+
+@pytest.mark.parametrize('reset_peak', [True, False])
+def test_peaks_of_nested_calls(monkeypatch, reset_peak):
+    monkeypatch.setattr(profiling, 'PROFILE_MEMORY', True)
+    monkeypatch.setattr(profiling, 'RESET_PEAK', reset_peak and hasattr(tracemalloc, 'reset_peak'))
+    try:
+        with collect() as records:
+            outer()
+    finally:
+        tracemalloc.stop()
+
+    peaks = {record['name']: record['peak_mb'] for record in records}
+    assert 50 <= peaks['outer'] < 55
+    if profiling.RESET_PEAK:
+        assert 10 <= peaks['inner'] < 15
+    else:
+        assert peaks['inner'] is None
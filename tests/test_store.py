@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from utils.aggregation import daily_counts
+from utils.emojis import emoji_table
+from utils.preprocessing import preprocess
+from utils.store import preprocess_incremental
+from utils.words import word_table
+
+MESSAGES = ['hello there 😂', '<Media omitted>', 'the assignment is due 👍👍', 'This message was deleted',
+            "who's coming tomorrow", 'see https://example.com 😂']
+
+
+def write_export(path, messages):
+    start = datetime(2021, 5, 10, 8, 0)
+    lines = []
+    for idx in range(messages):
+        sent = start + timedelta(minutes=37 * idx)
+        lines.append(f'{sent:%d/%m/%Y, %H:%M} - Member{idx % 4}: {MESSAGES[idx % len(MESSAGES)]}')
+
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def test_later_exports_only_add_their_new_messages(tmp_path):
+    fn = tmp_path / 'chat.txt'
+    for messages in (300, 700, 1000):
+        write_export(fn, messages)
+        stored, _ = preprocess_incremental(str(fn), str(tmp_path / 'store'))
+
+    chats, _ = preprocess(str(fn))
+
+    assert stored.index.equals(chats.index)
+    assert stored['message'].tolist() == chats['message'].tolist()
+    assert stored['word_count'].tolist() == chats['word_count'].tolist()
+    assert emoji_table(stored).frequencies().to_dict() == emoji_table(chats).frequencies().to_dict()
+    assert word_table(stored).frequencies().to_dict() == word_table(chats).frequencies().to_dict()
+    assert word_table(stored).frequencies('Member2').to_dict() == word_table(chats).frequencies('Member2').to_dict()
+
+    counts = stored.attrs['message_counts']
+    assert counts.by_user.to_dict() == chats['id'].value_counts().to_dict()
+
+    text = chats[~(chats.is_media | chats.is_deleted)]
+    for user in ('Overall', 'Member1'):
+        days, numbers = counts.daily(user)
+        expected = daily_counts((text if user == 'Overall' else text[text.id == user]).index.values)
+        assert days.tolist() == expected[0].tolist()
+        assert numbers.tolist() == expected[1].tolist()
@@ -0,0 +1,18 @@
+import pandas as pd
+
+from utils.words import word_table
+
+
+def test_word_counts_of_text_messages():
+    df = pd.DataFrame({
+        'id': ['Asha', 'Ravi', 'Asha', 'Ravi'],
+        'message': ["It's the test's test", 'photo', 'hello world 42', "It's the test's test"],
+        'is_media': [False, True, False, False],
+        'is_deleted': [False, False, False, False],
+    })
+
+    table = word_table(df)
+
+    assert table.frequencies().to_dict() == {'test': 4, 'hello': 1, 'world': 1}
+    assert table.frequencies('Ravi').to_dict() == {'test': 2}
+    assert word_table(df) is table
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+from utils.indexing import SharedTable
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PERIODS = [f'{hour}-{(hour + 1) % 24}' for hour in range(24)]
+
+# most points sent to the browser for a daily timeline, about one per pixel of its width
+DAILY_POINTS = 1000
+
+
+
+
+def activity_matrix(days_of_week, hours):
+    """
+    Number of messages in each day of week (monday is 0) and hour of day, as a 7x24 matrix
+    """
+    cells = np.asarray(days_of_week, dtype=np.int64) * 24 + np.asarray(hours, dtype=np.int64)
+    return np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+
+
+
+
+def daily_counts(datetimes):
+    """
+    Days with messages, and number of messages on each of them
+    """
+    days = np.asarray(datetimes, dtype='datetime64[D]').astype(np.int64)
+    if not len(days):
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64)
+
+    first = days.min()
+    counts = np.bincount(days - first)
+    active = np.flatnonzero(counts)
+    return (active + first).astype('datetime64[D]'), counts[active]
+
+
+
+
+class MessageCounts(SharedTable):
+    """
+    Messages of each user, and text messages of each user on each day, counted once per chat,
+    the store keeps them for each upload and merges them, like the emoji table
+    by_user: number of messages of each user
+    by_day: number of text messages of each user on each day, indexed by id and day
+    """
+    key = 'message_counts'
+
+    def __init__(self, df):
+        datetimes = df['datetime'].values if 'datetime' in df.columns else df.index.values
+        is_text = ~(df['is_media'].values | df['is_deleted'].values)
+
+        self.by_user = df.groupby('id', observed=True, sort=False).size()
+        days = pd.DataFrame({
+            'id': df['id'].values[is_text],
+            'day': datetimes[is_text].astype('datetime64[D]'),
+        })
+        self.by_day = days.groupby(['id', 'day'], observed=True, sort=False).size()
+
+    @classmethod
+    def from_counts(cls, by_user, by_day):
+        """
+        Counts of a chat from counts of its parts, such as the uploads of the store,
+        which may count the same user, or day, more than once
+        """
+        table = cls.__new__(cls)
+        table.by_user = by_user.groupby(level='id', observed=True, sort=False).sum()
+        table.by_day = by_day.groupby(level=['id', 'day'], observed=True, sort=False).sum()
+        return table
+
+    def daily(self, user='Overall'):
+        """
+        Days with text messages of user, in order, and number of them on each day, like daily_counts
+        """
+        if user.lower() == 'overall':
+            counts = self.by_day.groupby(level='day').sum()
+
+        elif user in self.by_day.index.get_level_values('id'):
+            counts = self.by_day.xs(user, level='id').sort_index()
+
+        else:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64)
+
+        return counts.index.values.astype('datetime64[D]'), counts.values.astype(np.int64)
+
+
+
+
+def lttb(x, y, threshold):
+    """
+    Positions of threshold points of the series (x, y) picked by largest triangle three buckets,
+    keeps the first and last points, and the peaks and dips a line chart of all points shows
+    """
+    num_points = len(x)
+    if threshold >= num_points or threshold < 3:
+        return np.arange(num_points)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # points between the first and the last are split into threshold - 2 buckets,
+    # from each the point forming the largest triangle with the last picked point,
+    # and the mean of the next bucket is kept
+    edges = np.linspace(1, num_points - 1, threshold - 1).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, num_points - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else num_points
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        picked[bucket + 1] = previous
+
+    return picked
+
+
+
+
+def downsample_daily(datetimes, threshold=DAILY_POINTS):
+    """
+    Daily message counts of datetimes, reduced to at most threshold days
+    Returns dataframe of datetime and message count
+    """
+    return downsample_days(*daily_counts(datetimes), threshold=threshold)
+
+
+
+
+def downsample_days(days, counts, threshold=DAILY_POINTS):
+    """
+    Message counts of days, in order, reduced to at most threshold days
+    Returns dataframe of datetime and message count
+    """
+    picked = lttb(days.astype(np.int64), counts, threshold)
+    return pd.DataFrame({'datetime': pd.to_datetime(days[picked]), 'message': counts[picked]})
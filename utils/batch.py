@@ -0,0 +1,200 @@
+"""
+Analyse many exported chats at once, without the app
+
+usage: python -m utils.batch EXPORTS [--out results] [--workers 4]
+EXPORTS is a directory of .txt or .zip exports, or a glob such as 'exports/*.txt'
+"""
+import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+import fire
+import numpy as np
+import pandas as pd
+from utils.aggregation import DAY_NAMES, activity_matrix, daily_counts
+from utils.emojis import emoji_table
+from utils.features import add_message_features
+from utils.preprocessing import parse_chat
+
+# stages of analyse, each timed on its own
+STAGES = ('parse', 'features', 'stats', 'active_users', 'emojis', 'timelines', 'write')
+
+# per user stats of the results, summed from the message features
+STAT_COLUMNS = {'messages': 'message', 'words': 'word_count', 'media': 'is_media', 'links': 'url_count',
+                'emojis': 'emoji_count'}
+
+
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Record seconds spent in the with block as timings[stage]
+    """
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+
+
+
+
+def find_exports(exports):
+    """
+    Text files and zip files of exports, a directory or a glob, in name order
+    """
+    if os.path.isdir(exports):
+        fns = glob.glob(os.path.join(exports, '*.txt')) + glob.glob(os.path.join(exports, '*.zip'))
+    else:
+        fns = glob.glob(exports)
+    return sorted(fn for fn in fns if os.path.isfile(fn))
+
+
+
+
+def results_table(table, user, key, value):
+    """
+    Rows of the results of a chat, every table of results shares the columns
+    table, user, key, and value so a chat fits in one columnar file
+    """
+    return pd.DataFrame({
+        'table': table,
+        'user': np.asarray(user, dtype=object),
+        'key': np.asarray(key, dtype=object).astype(str),
+        'value': np.asarray(value, dtype=np.int64),
+    })
+
+
+
+
+def analyse(fn, out):
+    """
+    Parse the export fn, and write its stats, active users, emoji,
+    and timeline aggregates to out, a parquet file
+    Returns summary of the chat with seconds spent in each stage
+    """
+    timings = {}
+    with timed(timings, 'parse'):
+        df = parse_chat(fn)
+
+    with timed(timings, 'features'):
+        df = add_message_features(df)
+
+    with timed(timings, 'stats'):
+        totals = {name: int(df[column].count() if name == 'messages' else df[column].sum())
+                  for name, column in STAT_COLUMNS.items()}
+        per_user = df.groupby('id', observed=True, sort=False).agg(
+            **{name: (column, 'count' if name == 'messages' else 'sum') for name, column in STAT_COLUMNS.items()})
+        stats = per_user.stack()
+        tables = [
+            results_table('stats', 'Overall', list(totals), list(totals.values())),
+            results_table('stats', stats.index.get_level_values(0), stats.index.get_level_values(1), stats.values),
+        ]
+
+    with timed(timings, 'active_users'):
+        users = per_user['messages'].sort_values(ascending=False, kind='mergesort')
+        tables.append(results_table('active_users', users.index, np.arange(1, len(users) + 1), users.values))
+
+    with timed(timings, 'emojis'):
+        emojis = emoji_table(df)
+        overall = emojis.frequencies()
+        by_user = emojis.by_user
+        tables += [
+            results_table('emojis', 'Overall', overall.index, overall.values),
+            results_table('emojis', by_user.index.get_level_values('id'),
+                          by_user.index.get_level_values('emoji'), by_user.values),
+        ]
+
+    with timed(timings, 'timelines'):
+        datetimes = pd.DatetimeIndex(df['datetime'])
+        days, counts = daily_counts(datetimes.values)
+        activity = activity_matrix(datetimes.dayofweek, datetimes.hour)
+        weekdays, hours = np.nonzero(activity)
+        tables += [
+            results_table('days', 'Overall', days, counts),
+            results_table('activity', 'Overall',
+                          [f'{DAY_NAMES[day]} {hour:02d}' for day, hour in zip(weekdays, hours)],
+                          activity[weekdays, hours]),
+        ]
+
+    with timed(timings, 'write'):
+        pd.concat(tables, ignore_index=True).to_parquet(out, index=False)
+
+    summary = {
+        'export': fn,
+        'results': out,
+        'members': len(users),
+        'first': datetimes.min() if len(df) else pd.NaT,
+        'last': datetimes.max() if len(df) else pd.NaT,
+        'active_days': len(days),
+        **totals,
+    }
+    summary.update((f'{stage}_s', timings[stage]) for stage in STAGES)
+    summary['total_s'] = sum(timings.values())
+    return summary
+
+
+
+
+def results_names(exports):
+    """
+    Name of the results file of each export, exports of the same name in different directories
+    are told apart by a number, and none is named like the summary of all chats
+    """
+    names, issued = [], {'summary'}
+    for fn in exports:
+        base = name = os.path.splitext(os.path.basename(fn))[0]
+        number = 1
+        # names differing only in case are the same file on some file systems
+        while name.lower() in issued:
+            number += 1
+            name = f'{base}-{number}'
+
+        issued.add(name.lower())
+        names.append(f'{name}.parquet')
+
+    return names
+
+
+
+
+def main(exports, out='results', workers=None):
+    """
+    Analyse every export of exports on a pool of workers processes,
+    one per cpu by default, writing one results file per chat to directory out,
+    and a summary of all chats, with timings of each stage, to out/summary.parquet
+    """
+    fns = find_exports(exports)
+    if not fns:
+        raise SystemExit(f'no exports found at {exports}')
+
+    os.makedirs(out, exist_ok=True)
+    start = time.perf_counter()
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {pool.submit(analyse, fn, os.path.join(out, name)): fn
+                for fn, name in zip(fns, results_names(fns))}
+
+        for job in as_completed(jobs):
+            try:
+                rows.append(job.result())
+            except Exception as exc:
+                # one export that fails to parse does not stop the others
+                rows.append({'export': jobs[job], 'error': f'{type(exc).__name__}: {exc}'})
+
+    summary = pd.DataFrame(rows).sort_values('export', kind='mergesort').reset_index(drop=True)
+    if 'error' not in summary.columns:
+        summary['error'] = None
+    summary.to_parquet(os.path.join(out, 'summary.parquet'), index=False)
+
+    seconds = time.perf_counter() - start
+    print(summary.drop(columns=['results'], errors='ignore').to_string(index=False))
+    print(f'{len(fns)} exports, {int(summary.get("messages", pd.Series([], dtype=np.int64)).sum()):,} messages in {seconds:.2f} s, '
+          f'results in {out}')
+
+
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
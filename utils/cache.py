@@ -0,0 +1,179 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+
+
+def content_hash(data):
+    """
+    Hex digest of bytes, or of any buffer such as a memoryview of an upload
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+
+
+class LRUCache:
+    """
+    Thread safe mapping that keeps at most max_entries items,
+    evicting the least recently used one first
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def get_or_compute(self, key, fn, *args, **kwargs):
+        """
+        Returns the cached value of key, or computes it with fn(*args, **kwargs) and caches it,
+        fn runs outside the lock, so a slow computation doesn't block other keys
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = fn(*args, **kwargs)
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+
+
+class DiskCache:
+    """
+    Directory of cache entries, each entry is a file or a directory named by its key,
+    the least recently used entries are removed once they take more than max_bytes
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Returns path of the entry of key, or None when there is none
+        """
+        path = self.path(key)
+        try:
+            # mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def put(self, key, write):
+        """
+        Create the entry of key with write(path), which must create a file or directory at path,
+        the entry only appears once it is complete. When another writer completed the entry
+        meanwhile, as two sessions uploading the same chat at once do, its entry is kept
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            write(os.path.join(staging, key))
+            try:
+                os.replace(os.path.join(staging, key), self.path(key))
+            except OSError:
+                # directories are not replaced when the target exists and is not empty
+                if not os.path.exists(self.path(key)):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict(keep=key)
+        return self.path(key)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries, other than keep, until the rest fit in max_bytes,
+        entries another writer removes meanwhile are skipped, as several sessions share a cache
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp-') or name == keep:
+                continue
+
+            path = self.path(name)
+            try:
+                entries.append((os.path.getmtime(path), _size(path), path))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        if keep is not None:
+            try:
+                total += _size(self.path(keep))
+            except FileNotFoundError:
+                pass
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+
+
+def _size(path):
+    """
+    Size of a file, or of all files under a directory, in bytes,
+    files removed while the directory is walked are not counted
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+
+    return size
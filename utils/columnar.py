@@ -0,0 +1,81 @@
+import os
+import json
+import pandas as pd
+from pyarrow import feather
+from utils.cache import DiskCache
+from utils.emojis import EmojiTable, emoji_table
+from utils.indexing import add_user_index
+from utils.preprocessing import preprocess
+from utils.profiling import profiled
+
+# frames of preprocess are kept on disk in arrow's feather format, one directory per upload
+FRAME_CACHE_DIR = os.environ.get(
+    'FRAME_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'whatsapp-chat-analysis', 'frames'))
+FRAME_CACHE_BYTES = int(os.environ.get('FRAME_CACHE_BYTES', 4 << 30))
+frame_cache = DiskCache(FRAME_CACHE_DIR, FRAME_CACHE_BYTES)
+
+
+
+
+def write_frames(chats, chats_with_features, path):
+    """
+    Write the frames of preprocess, and their emoji table, to directory path,
+    uncompressed so that they can be memory mapped when read back
+    """
+    os.makedirs(path)
+
+    # one table holds the columns of both frames, they have the same rows,
+    # a new frame is written as the attrs of the frames hold indexes
+    columns = {'datetime': chats.index.values}
+    columns.update((column, chats_with_features[column].values) for column in chats_with_features.columns)
+    feather.write_feather(pd.DataFrame(columns), os.path.join(path, 'chats.feather'),
+                          compression='uncompressed')
+
+    feather.write_feather(emoji_table(chats).occurrences, os.path.join(path, 'emojis.feather'),
+                          compression='uncompressed')
+
+    with open(os.path.join(path, 'frames.json'), 'w') as f:
+        json.dump({'chats': chats.columns.tolist()}, f)
+
+
+
+
+@profiled
+def read_frames(path):
+    """
+    Read the frames written by write_frames, numeric columns are memory mapped
+    rather than read into memory
+    """
+    def read(name):
+        # most messages are distinct, looking for repeated ones to share takes longer than the read
+        table = feather.read_table(os.path.join(path, name), memory_map=True)
+        return table.to_pandas(split_blocks=True, deduplicate_objects=False)
+
+    with open(os.path.join(path, 'frames.json')) as f:
+        chat_columns = json.load(f)['chats']
+
+    chats_with_features = read('chats.feather').set_index('datetime')
+    chats = chats_with_features[chat_columns]
+
+    add_user_index(chats, chats_with_features)
+    emojis = EmojiTable.from_occurrences(read('emojis.feather'), chats['emoji_count'].values)
+    emojis.attach(chats)
+    emojis.attach(chats_with_features)
+
+    return chats, chats_with_features
+
+
+
+
+def preprocess_cached(fn, key):
+    """
+    Frames of preprocess for an upload with key, such as its content hash,
+    read from the frame cache, or preprocessed and written to it
+    """
+    path = frame_cache.get(key)
+    if path is not None:
+        return read_frames(path)
+
+    chats, chats_with_features = preprocess(fn)
+    frame_cache.put(key, lambda path: write_frames(chats, chats_with_features, path))
+    return chats, chats_with_features
@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import pandas as pd
+from utils.indexing import SharedTable, attached
+
+# a conversation session ends after this long without messages
+SESSION_IDLE = pd.Timedelta(os.environ.get('SESSION_IDLE', '1H'))
+
+
+
+
+class Conversations(SharedTable):
+    """
+    Messages of a chat in time order as conversations, built once per chat
+    and shared by the frames it was attached to, like the word table.
+    gaps: seconds since the previous message, NaN for the first
+    sessions: session of each message, a new one starts after a gap longer than idle
+    replied: code of the user each message replies to, the sender of the previous message
+    of the session when it was someone else, or -1
+    """
+    key = 'conversations'
+
+    def __init__(self, df, idle=SESSION_IDLE):
+        users = pd.Categorical(df['id'].values)
+        times = df.index.values.astype('datetime64[ns]')
+        codes = users.codes.astype(np.int64)
+        if not df.index.is_monotonic_increasing:
+            order = np.argsort(times, kind='stable')
+            times, codes = times[order], codes[order]
+
+        self.users = users.categories
+        self.times = times
+        self.codes = codes
+
+        gaps = np.diff(times).astype(np.int64) / 1e9
+        self.gaps = np.concatenate([[np.nan], gaps])
+        starts = np.concatenate([[len(times) > 0], gaps > idle.total_seconds()])
+        self.sessions = np.cumsum(starts) - 1
+        self.session_starts = np.flatnonzero(starts)
+
+        previous = np.concatenate([[-1], codes[:-1]])
+        self.replied = np.where(~starts & (previous != codes), previous, -1)
+
+    def session_table(self):
+        """
+        One row per session: its first message, minutes from first to last message,
+        number of messages, and of members who sent them
+        """
+        ends = np.append(self.session_starts[1:], len(self.times))[:len(self.session_starts)] - 1
+        duration = (self.times[ends] - self.times[self.session_starts]) / np.timedelta64(1, 'm')
+
+        # distinct pairs of session and user, counted per session
+        pairs = np.unique(self.sessions * len(self.users) + self.codes)
+        members = np.bincount(pairs // max(len(self.users), 1), minlength=len(self.session_starts))
+
+        return pd.DataFrame({
+            'start': self.times[self.session_starts],
+            'minutes': duration,
+            'messages': ends - self.session_starts + 1,
+            'members': members,
+        })
+
+    def user_sessions(self, user):
+        """
+        Sessions user sent messages in
+        """
+        if user not in self.users:
+            return np.array([], dtype=np.int64)
+
+        return np.unique(self.sessions[self.codes == self.users.get_loc(user)])
+
+    def reply_matrix(self):
+        """
+        Sparse users x users matrix of the number of replies
+        of each user, by row, to each user, by column
+        """
+        from scipy import sparse
+
+        replies = self.replied >= 0
+        shape = (len(self.users), len(self.users))
+        return sparse.coo_matrix((np.ones(replies.sum(), dtype=np.int64),
+                                  (self.codes[replies], self.replied[replies])), shape=shape).tocsr()
+
+    def reply_gaps(self, user='Overall'):
+        """
+        Seconds each reply of user came after the message it replied to
+        """
+        replies = self.replied >= 0
+        if user.lower() != 'overall':
+            replies &= self.codes == (self.users.get_loc(user) if user in self.users else -1)
+
+        return self.gaps[replies]
+
+    def response_latency(self):
+        """
+        Median seconds to reply of each user who replied, and their number of replies
+        """
+        replies = self.replied >= 0
+        gaps = pd.Series(self.gaps[replies])
+        grouped = gaps.groupby(pd.Categorical.from_codes(self.codes[replies], self.users), observed=True)
+        return pd.DataFrame({'seconds': grouped.median(), 'replies': grouped.size()})
+
+
+
+
+def conversations(df):
+    """
+    Conversations of a chat frame indexed by datetime, built on first use and attached to df,
+    so that every later section of the chat reuses them
+    """
+    return attached(df, Conversations.key, Conversations)
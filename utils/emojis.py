@@ -0,0 +1,166 @@
+import re
+import numpy as np
+import pandas as pd
+import emoji
+from utils.indexing import SharedTable, attached
+
+
+
+
+def _trie(words):
+    """
+    Regex matching any of words, nested by common prefixes so that
+    each position is compared with one character at a time, longest match first
+    """
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(root)
+
+
+
+
+def _charset(chars):
+    """
+    Character class of chars, written as ranges of consecutive code points
+    """
+    ranges = []
+    for code in sorted(set(map(ord, chars))):
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+
+    return '[' + ''.join(
+        re.escape(chr(start)) + ('-' + re.escape(chr(end)) if end > start else '')
+        for start, end in ranges
+    ) + ']'
+
+
+
+
+EMOJIS = list(emoji.UNICODE_EMOJI['en'])
+
+# the lookahead skips positions that cannot start an emoji
+# before trying the alternatives of the trie
+EMOJI_PATTERN = re.compile('(?=' + _charset(word[0] for word in EMOJIS) + ')' + _trie(EMOJIS))
+
+# every emoji has a character above U+00A8 (keycaps end with U+20E3),
+# messages without one are skipped altogether
+CANDIDATE_PATTERN = re.compile(r'[^\x00-\xa8]')
+
+
+
+
+def find_emojis(messages):
+    """
+    Emojis in series messages, one row per emoji in order of appearance,
+    indexed by the position of its message in messages
+    """
+    candidates = np.flatnonzero(messages.str.contains(CANDIDATE_PATTERN).values.astype(bool))
+    found = pd.Series(messages.values[candidates]).str.findall(EMOJI_PATTERN).explode().dropna()
+    return pd.Series(found.values, index=candidates[found.index.values], dtype=object)
+
+
+
+
+def count_emojis(messages):
+    """
+    Number of emojis in each message of series messages
+    """
+    positions = find_emojis(messages).index.values
+    return np.bincount(positions, minlength=len(messages)).astype(np.int32)
+
+
+
+
+class EmojiTable(SharedTable):
+    """
+    Emojis of the text messages of a chat, found once per chat
+    and shared by the frames of preprocess, like the user index
+    counts: number of emojis in each message
+    occurrences: one row per emoji with its sender, and the end of its month
+    by_user, by_month: emoji frequencies of each user, and of each month
+    """
+    key = 'emoji_table'
+
+    def __init__(self, df):
+        messages = df['message']
+        if 'is_media' in df.columns:
+            messages = messages.where(~(df['is_media'] | df['is_deleted']), '')
+
+        found = find_emojis(messages)
+        positions = found.index.values
+        self.counts = np.bincount(positions, minlength=len(df)).astype(np.int32)
+
+        # months are labelled by their last day, as by resample('M')
+        datetimes = pd.DatetimeIndex(df['datetime'] if 'datetime' in df.columns else df.index)
+        months = datetimes[positions].to_period('M').to_timestamp(how='end').normalize()
+
+        self._summarize(pd.DataFrame({
+            'id': df['id'].values[positions],
+            'month': months,
+            'emoji': found.values,
+        }))
+
+    @classmethod
+    def from_occurrences(cls, occurrences, counts):
+        """
+        Table of emojis found before, such as a table read back from disk
+        """
+        table = cls.__new__(cls)
+        table.counts = counts
+        table._summarize(occurrences)
+        return table
+
+    def _summarize(self, occurrences):
+        self.occurrences = occurrences
+        self.by_user = occurrences.groupby(['id', 'emoji'], observed=True, sort=False).size()
+        self.by_month = occurrences.groupby(['month', 'emoji'], sort=False).size()
+
+    def frequencies(self, user='Overall'):
+        """
+        Number of times each emoji was used by user, most used first
+        """
+        if user.lower() == 'overall':
+            counts = self.occurrences['emoji'].value_counts()
+
+        elif user in self.by_user.index.get_level_values('id'):
+            counts = self.by_user.xs(user, level='id').sort_values(ascending=False, kind='mergesort')
+
+        else:
+            counts = pd.Series([], dtype=np.int64)
+
+        return counts
+
+    def monthly(self, user='Overall'):
+        """
+        Number of times each emoji was used by user in each month
+        """
+        if user.lower() == 'overall':
+            return self.by_month
+
+        occurrences = self.occurrences[self.occurrences['id'] == user]
+        return occurrences.groupby(['month', 'emoji'], sort=False).size()
+
+
+
+
+def emoji_table(df):
+    """
+    Emoji table of a chat frame, the one built by preprocess when it covers df,
+    otherwise a new one attached to df
+    """
+    return attached(df, EmojiTable.key, EmojiTable)
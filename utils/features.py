@@ -0,0 +1,90 @@
+import re
+import numpy as np
+import pandas as pd
+from urlextract import URLExtract
+from utils.emojis import EmojiTable
+
+# placeholders exports write instead of attachments, android first, then iOS
+MEDIA_MESSAGES = [
+    '<Media omitted>',
+    'image omitted',
+    'video omitted',
+    'audio omitted',
+    'sticker omitted',
+    'GIF omitted',
+    'document omitted',
+    'Contact card omitted',
+]
+
+DELETED_MESSAGES = [
+    'This message was deleted',
+    'You deleted this message',
+]
+
+# iOS exports prefix placeholders with a left-to-right mark
+MEDIA_MESSAGES += ['\u200e' + message for message in MEDIA_MESSAGES]
+DELETED_MESSAGES += ['\u200e' + message for message in DELETED_MESSAGES]
+
+urlextractor = URLExtract()
+
+# urlextract looks for known top level domains after a dot, besides localhost
+# and ip addresses, messages with none of these can't have a url
+URL_CANDIDATE_PATTERN = re.compile(r'\.[^\W\d_]{2}|localhost|\d\.\d{1,3}\.\d{1,3}\.\d', re.IGNORECASE)
+
+
+
+
+def count_urls(messages):
+    """
+    Number of urls in each message of series messages,
+    only tokens that pass a regex prefilter are sent to urlextract
+    """
+    counts = np.zeros(len(messages), dtype=np.int32)
+    candidates = messages.str.contains(URL_CANDIDATE_PATTERN).values.astype(bool)
+    if not candidates.any():
+        return counts
+
+    # urls never span whitespace, so each distinct token is looked up once,
+    # shared links are repeated a lot in group chats
+    tokens = pd.Series(messages.values[candidates]).str.split().explode()
+    tokens = tokens[tokens.str.contains(URL_CANDIDATE_PATTERN).astype(bool)]
+    found = {token: len(urlextractor.find_urls(token)) for token in tokens.unique()}
+
+    per_message = tokens.map(found).groupby(level=0).sum()
+    counts[np.flatnonzero(candidates)[per_message.index.values]] = per_message.values
+    return counts
+
+
+
+
+def add_message_features(df):
+    """
+    Adds per message columns used by the helpers to df inplace,
+    so they are computed once per chat instead of once per plot
+    is_media, is_deleted: message is an attachment placeholder, or a deleted message
+    word_count, url_count, emoji_count: counts in the message text
+    the emojis found are kept in an emoji table attached to df
+    """
+    messages = df['message']
+
+    df['id'] = df['id'].astype('category')
+    df['is_media'] = messages.isin(MEDIA_MESSAGES).values
+    df['is_deleted'] = messages.isin(DELETED_MESSAGES).values
+
+    # placeholders are not text written by the user, and count as nothing
+    is_text = ~(df['is_media'].values | df['is_deleted'].values)
+    texts = messages[is_text]
+
+    counts = {
+        'word_count': texts.str.count(r'\S+').values,
+        'url_count': count_urls(texts),
+    }
+    for column, values in counts.items():
+        column_values = np.zeros(len(df), dtype=np.int32)
+        column_values[is_text] = values
+        df[column] = column_values
+
+    table = EmojiTable(df)
+    df['emoji_count'] = table.counts
+    table.attach(df)
+    return df
@@ -1,68 +1,91 @@
+import numpy as np
 import pandas as pd
-from collections import Counter
-from wordcloud import WordCloud
-import emoji
-import altair as alt
-from urlextract import URLExtract
-import plotly.graph_objects as go
+from utils.aggregation import DAY_NAMES, PERIODS, MessageCounts, activity_matrix, downsample_daily, downsample_days
+from utils.dynamics import conversations
+from utils.emojis import emoji_table
+from utils.indexing import attached, select_user, time_index
+from utils.profiling import profiled
+from utils.words import CLOUD_WORDS, cloud_png, word_table
 
-urlextractor = URLExtract()
+# hover texts are cut to this many characters, to keep the figures small
+HOVER_TEXT_LENGTH = 80
 
+# members shown by the reply map, and by the chart of response times
+REPLY_MAP_USERS = 15
+RESPONSE_TIME_USERS = 10
+
+@profiled
 def fetch_messages(df, user):
     """
     Returns messages of selected user
     """
     if user.lower() != 'overall':
-        df = df[df.id == user]
+        df = select_user(df, user)
 
-    df = df[df.message != '<Media omitted>']
-    df = df[df.message != 'This message was deleted']
+    df = df[~(df.is_media | df.is_deleted)]
 
     return df
 
 
 
 
-def fetch_stats(df, user):
+@profiled
+def fetch_stats(df, user, window=None):
     """
-    Returns stats on number of messages, members, media files, links shared
+    Returns stats on number of messages, members, media files, links shared,
+    of messages sent in window, a pair of first and last day, if given
     """
+    if window is not None:
+        # running totals of the time index, without scanning the window
+        return time_index(df).stats(user, *window)
+
     if user.lower() != 'overall':
-        df = df[df.id == user]
+        df = select_user(df, user)
 
     # 1. fetch number of messages
     num_messages = df.message.shape[0]
 
     # 2. count number of words, and
-    # 3. number of urls
-    words = []
-    urls = []
-    for message in df.message:
-        words.extend(message)
-        urls.extend(urlextractor.find_urls(message))
-
-    num_words = len(words)
-    num_links = len(urls)
+    # 3. number of urls, both counted per message by preprocess
+    num_words = int(df.word_count.sum())
+    num_links = int(df.url_count.sum())
 
     # 4. number of media files shared
-    num_medias = df[df.message == '<Media omitted>'].shape[0]
+    num_medias = int(df.is_media.sum())
     
     return num_messages, num_words, num_medias, num_links
 
 
 
 
-def fetch_active_users(df):
+@profiled
+def fetch_active_users(df, window=None):
     """
-    Return dataframe on most active users
+    Return dataframe on most active users,
+    of messages sent in window, a pair of first and last day, if given
     """
-    new_df = (df['id'].value_counts()
+    stored = attached(df, MessageCounts.key)
+    if window is not None or stored is not None:
+        # every user is counted, as value_counts counts every category of id,
+        # chats read back from the store come with the counts of every upload
+        users = time_index(df).user_counts(*window) if window is not None else stored.by_user.to_dict()
+        counts = pd.Series(users, dtype=np.int64).reindex(df['id'].cat.categories, fill_value=0)
+        counts = counts.sort_values(ascending=False, kind='mergesort')
+        counts.index = pd.CategoricalIndex(counts.index, categories=df['id'].cat.categories)
+        counts.name = 'id'
+        total = int(counts.sum())
+
+    else:
+        counts = df['id'].value_counts()
+        total = int(df.shape[0])
+
+    new_df = (counts
                     .reset_index()
                     .rename(columns={'index': 'User', 'id':'Messages'})
                     .sort_values(by='Messages', ascending=False)
     )
 
-    active_users_percent = ( (df.id.value_counts()/int(df.shape[0]) * 100)
+    active_users_percent = ( (counts/total * 100)
                                 .apply(lambda x: f'{x:.2f}')
                                 .reset_index()
                                 .rename(columns={'index': 'User', 'id':'Messages(%)'})
@@ -74,43 +97,42 @@ def fetch_active_users(df):
 
 
 
+@profiled
 def get_wordcloud(df, user):
     """
-    Generates word cloud
+    Generates word cloud of user, from the word frequencies
+    counted once per chat by the word table
     """
-    if user.lower() != 'overall':
-        df = df[df.id == user]
+    from wordcloud import WordCloud
 
-    df = df[df.message != '<Media omitted>']
-    df = df[df.message != 'This message was deleted']
+    frequencies = word_table(df).frequencies(user).head(CLOUD_WORDS)
 
-    wc = WordCloud(width=700, height=300, min_font_size=12, background_color='white')
-    wc = wc.generate(df['message'].str.cat(sep=' '))
+    wc = WordCloud(width=700, height=300, min_font_size=12, background_color='white', max_words=CLOUD_WORDS)
+    wc = wc.generate_from_frequencies(frequencies.to_dict())
     return wc
 
 
 
 
+@profiled
+def wordcloud_image(df, user):
+    """
+    Word cloud of user as PNG bytes, small enough to cache for every user
+    """
+    return cloud_png(get_wordcloud(df, user))
+
 
+
+
+
+@profiled
 def most_common_emojis(df, user, n=10):
     """
-    Tokenize each message, and build list of nouns, verbs, phrases 
-    to return "n" most common words, and emojis
+    Return barchart of "n" most common emojis of user,
+    counted from the emoji table of the chat
     """
-    if user.lower() != 'overall':
-        df = df[df.id == user]
+    common_emojis = list(emoji_table(df).frequencies(user).head(n).items())
 
-    df = df[df.message != '<Media omitted>']
-    df = df[df.message != 'This message was deleted']
-    
-    # tokenize
-    tokens = [word for msg in df.message for word in msg.split()]
-
-    # filter emojis
-    emojis = [word for word in tokens if word in emoji.UNICODE_EMOJI['en']]
-    common_emojis = Counter(emojis).most_common(n)
-    del emojis
- 
     # create a dataframe and build a barchart
     def to_barchart(table):
         df = pd.DataFrame(table)
@@ -128,6 +150,8 @@ def _get_barchart(df, x, y, color, label):
     """
     helper function to build a barchart
     """
+    import altair as alt
+
     bar_chart = alt.Chart(df).mark_bar(
                         cornerRadiusTopLeft=3,
                         cornerRadiusTopRight=3,
@@ -149,25 +173,35 @@ def _get_barchart(df, x, y, color, label):
 
 
 
-def timeline_stats(df, user):
+@profiled
+def timeline_stats(df, user, window=None):
     """
-    Return timespan of messages, first message date, and last message date
+    Return timespan of messages, first message date, and last message date,
+    of messages sent in window, a pair of first and last day, if given
     """
+    if window is not None:
+        timespan = time_index(df).timespan(user, *window)
+        if timespan is None:
+            return 0, '-', '-'
+
+        total_days, first, last = timespan
+        first, last = pd.Timestamp(first), pd.Timestamp(last)
+        return total_days, f'{first.day}-{first.month}-{first.year}', f'{last.day}-{last.month}-{last.year}'
+
     if user.lower() != 'overall':
-        df = df[df.id == user]
+        df = select_user(df, user)
 
-    df = df[df.message != '<Media omitted>']
-    df = df[df.message != 'This message was deleted']
+    df = df[~(df.is_media | df.is_deleted)]
 
     if user.lower() == 'overall':
         total_days = df.Elapsed.max() 
     else:
         total_days = df.groupby(df.Elapsed)['message'].count().shape[0]
 
-    first_date = df.iloc[0, [7, 5, 4]].to_dict()
+    first_date = df[['Day', 'Month', 'Year']].iloc[0].to_dict()
     first_date = f"{first_date['Day']}-{first_date['Month']}-{first_date['Year']}"
 
-    last_date = df.iloc[-1, [7, 5, 4]].to_dict()
+    last_date = df[['Day', 'Month', 'Year']].iloc[-1].to_dict()
     last_date = f"{last_date['Day']}-{last_date['Month']}-{last_date['Year']}"
 
     return total_days, first_date, last_date
@@ -175,40 +209,108 @@ def timeline_stats(df, user):
 
 
 
+def _top_messages(messages, buckets, max_length=HOVER_TEXT_LENGTH):
+    """
+    Most repeated message of each bucket, for several bucketings of messages at once,
+    ties go to the message sent first
+    buckets: dict of name and bucket label of each message
+    Returns dict of name and series of hover text indexed by bucket label
+    """
+    if not len(messages):
+        return {name: pd.Series([], dtype=object) for name in buckets}
+
+    # codes number messages in order of first appearance
+    codes, uniques = pd.factorize(messages.values)
+    num_codes = max(len(uniques), 1)
+
+    # number every bucket of every bucketing, and count (bucket, message) pairs in one go,
+    # pairs come out sorted by bucket, then code
+    labels, keys, offset = {}, [], 0
+    for name, values in buckets.items():
+        bucket_codes, labels[name] = pd.factorize(values)
+        keys.append((bucket_codes.astype(np.int64) + offset) * num_codes + codes)
+        offset += len(labels[name])
+
+    pairs, counts = np.unique(np.concatenate(keys), return_counts=True)
+    bucket, code = np.divmod(pairs, num_codes)
+
+    # first pair with the highest count in each bucket
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    best = np.repeat(np.maximum.reduceat(counts, starts), np.diff(np.r_[starts, len(pairs)]))
+    top = np.flatnonzero(counts == best)
+    top = top[np.r_[True, bucket[top][1:] != bucket[top][:-1]]]
+    bucket, code = bucket[top], code[top]
+
+    text = pd.Series(uniques[code], dtype=object)
+    long = text.str.len() > max_length
+    text[long] = text[long].str.slice(0, max_length - 1) + '…'
+
+    tops, offset = {}, 0
+    for name, index in labels.items():
+        in_bucketing = (bucket >= offset) & (bucket < offset + len(index))
+        tops[name] = pd.Series(text.values[in_bucketing], index=index[bucket[in_bucketing] - offset])
+        offset += len(index)
+
+    return tops
+
+
+
+
+@profiled
 def get_timelines(df, user):
     """
     Build line chart to showcase yearly timeline, 
     and chart charts to show  most active months, day of week, and hour of day
     """
-    if user.lower() != 'overall':
-        df = df[df.id == user]
+    import plotly.graph_objects as go
 
-    df = df[df.message != '<Media omitted>']
-    df = df[df.message != 'This message was deleted']
+    stored = attached(df, MessageCounts.key)
 
-    # timelines
-    yearly_timeline = df.resample('M')['message'].count().reset_index()
-    yearly_text = df.resample('M')['message'].apply(pd.Series.mode).tolist()
-
-    df_emojis = df['message'].apply(lambda lst:[x if x in emoji.UNICODE_EMOJI['en'] else -1 for x in lst][0])
-    df_emojis = df[df_emojis!=-1]
+    # most used emoji of each month
+    monthly_emojis = emoji_table(df).monthly(user).sort_values(ascending=False, kind='mergesort')
+    df_emojis = (monthly_emojis.groupby(level='month', sort=True).head(1)
+                               .sort_index(level='month')
+                               .reset_index()
+                               .rename(columns={'month': 'datetime', 'emoji': 'message'}))
 
-    levels = ['datetime']
-    for idx in range(df_emojis.index.nlevels-1):
-        levels.append(idx)
+    if user.lower() != 'overall':
+        df = select_user(df, user)
 
-    df_emojis = df_emojis['message'].resample('M').apply(pd.Series.mode).reset_index(level=levels)
+    df = df[~(df.is_media | df.is_deleted)]
 
-    daily_timeline = df.resample('D')['message'].count().reset_index()
-    daily_timeline = daily_timeline[daily_timeline['message'] != 0]
-    daily_text = df.resample('D')['message'].apply(pd.Series.mode).tolist()
+    # hover texts show the most repeated message of each month, day, hour, and day of week
+    days_of_week, hours = df.index.dayofweek, df.index.hour
+    top_messages = _top_messages(df['message'], {
+        'month': df.index.year * 12 + df.index.month,
+        'day': df.index.normalize(),
+        'hour': hours,
+        'weekday': days_of_week,
+    })
 
-    # most active days, and hours
-    hourly_timeline = df.groupby([df.index.hour])['message'].count().reset_index()
-    hourly_text = df.groupby([df.index.hour])['message'].apply(pd.Series.mode).reset_index()['message'].tolist()
+    # timelines
+    yearly_timeline = df.resample('M')['message'].count().reset_index()
+    months = yearly_timeline['datetime'].dt.year * 12 + yearly_timeline['datetime'].dt.month
+    yearly_text = top_messages['month'].reindex(months, fill_value='').tolist()
 
-    weekly_timeline = df.groupby([df.index.day_name()])['message'].count().reset_index()
-    weekly_text = df.groupby([df.index.day_name()])['message'].apply(pd.Series.mode).reset_index()['message'].tolist()
+    # days with messages, downsampled to about one point per pixel
+    if stored is not None:
+        daily_timeline = downsample_days(*stored.daily(user))
+    else:
+        daily_timeline = downsample_daily(df.index.values)
+    daily_text = top_messages['day'].reindex(daily_timeline['datetime']).tolist()
+
+    # most active days, and hours, both totals of the day x hour matrix
+    activity = activity_matrix(days_of_week, hours)
+    active_hours = np.flatnonzero(activity.sum(axis=0))
+    hourly_timeline = pd.DataFrame({'datetime': active_hours, 'message': activity.sum(axis=0)[active_hours]})
+    hourly_text = top_messages['hour'].reindex(active_hours).tolist()
+
+    active_days = np.flatnonzero(activity.sum(axis=1))
+    weekly_timeline = pd.DataFrame({
+        'datetime': np.array(DAY_NAMES)[active_days],
+        'message': activity.sum(axis=1)[active_days],
+    })
+    weekly_text = top_messages['weekday'].reindex(active_days).tolist()
 
     # yearly timeline displaying total messages in each month-year
     monthly_fig = go.Figure()
@@ -332,20 +434,108 @@ def get_timelines(df, user):
 
 
 
-def get_activity_map(df, user):
+@profiled
+def get_activity_map(df, user, window=None):
     """
-    Plot activity map for each day and hour
+    Plot activity map for each day and hour,
+    of messages sent in window, a pair of first and last day, if given
     """
-    if user.lower() != 'overall':
-        df = df[df.id == user]
+    import altair as alt
+
+    if window is not None:
+        activity = time_index(df).activity_matrix(user, *window)
+
+    else:
+        if user.lower() != 'overall':
+            df = select_user(df, user)
+        activity = activity_matrix(df['Dayofweek'].values, df['hour'].values)
+
+    # one cell per day and hour with messages, at most 7x24 rows
+    days, hours = np.nonzero(activity)
+    df = pd.DataFrame({
+        'DayName': np.array(DAY_NAMES)[days],
+        'period': np.array(PERIODS)[hours],
+        'message': activity[days, hours],
+    })
 
-    df['period'] = df['hour'].astype(str) + '-' + ((df['hour'] + 1) % 24).astype(str)
-    df = df.groupby(['DayName', 'period'])['message'].count().reset_index()
-    df = df.fillna(1)
-    # pivot = df.pivot_table(index='DayName', columns='period', values='message', aggfunc='count').fillna(0)
     fig = alt.Chart(df).mark_rect().encode(
-            alt.X('period:O', axis=alt.Axis(title='hours')),
-            alt.Y('DayName:O', axis=alt.Axis(title='days')),
+            alt.X('period:O', axis=alt.Axis(title='hours'), sort=PERIODS),
+            alt.Y('DayName:O', axis=alt.Axis(title='days'), sort=DAY_NAMES),
             alt.Color('message:Q', scale=alt.Scale(scheme='goldorange'))
         )
     return fig
+
+
+
+
+@profiled
+def conversation_stats(df, user):
+    """
+    Return number of conversations, median messages and minutes of a conversation,
+    of conversations user took part in, and median minutes user took to reply
+    """
+    chat = conversations(df)
+    sessions = chat.session_table()
+    if user.lower() != 'overall':
+        sessions = sessions.iloc[chat.user_sessions(user)]
+
+    gaps = chat.reply_gaps(user)
+    minutes_to_reply = f'{np.median(gaps) / 60:.1f}' if len(gaps) else '-'
+    if sessions.empty:
+        return 0, '-', '-', minutes_to_reply
+
+    return (len(sessions), f"{sessions['messages'].median():.0f}", f"{sessions['minutes'].median():.0f}",
+            minutes_to_reply)
+
+
+
+
+@profiled
+def get_reply_map(df, user):
+    """
+    Plot number of replies between the members who reply most, or between user
+    and the members user exchanges most replies with
+    """
+    import altair as alt
+
+    chat = conversations(df)
+    matrix = chat.reply_matrix()
+    exchanged = np.asarray(matrix.sum(axis=0)).ravel() + np.asarray(matrix.sum(axis=1)).ravel()
+
+    if user.lower() != 'overall' and user in chat.users:
+        code = chat.users.get_loc(user)
+        exchanged = matrix[code].toarray().ravel() + matrix[:, code].toarray().ravel()
+        exchanged[code] = 0
+        members = np.argsort(-exchanged, kind='stable')[:REPLY_MAP_USERS - 1]
+        members = np.append(members[exchanged[members] > 0], code)
+
+    else:
+        members = np.argsort(-exchanged, kind='stable')[:REPLY_MAP_USERS]
+        members = members[exchanged[members] > 0]
+
+    # one cell per pair of members who replied to each other
+    replies = matrix[members][:, members].tocoo()
+    names = np.asarray(chat.users)[members]
+    df = pd.DataFrame({'User': names[replies.row], 'Replied to': names[replies.col], 'Replies': replies.data})
+
+    fig = alt.Chart(df).mark_rect().encode(
+            alt.X('Replied to:N', axis=alt.Axis(labelAngle=45), sort=list(names)),
+            alt.Y('User:N', sort=list(names)),
+            alt.Color('Replies:Q', scale=alt.Scale(scheme='goldorange')),
+            tooltip=['User', 'Replied to', 'Replies'],
+        )
+    return fig
+
+
+
+
+@profiled
+def get_response_times(df):
+    """
+    Plot median minutes to reply of the members who reply most
+    """
+    latency = conversations(df).response_latency()
+    latency = latency.sort_values('replies', ascending=False, kind='mergesort').head(RESPONSE_TIME_USERS)
+
+    df = pd.DataFrame({'User': latency.index.astype(str), 'Minutes': (latency['seconds'] / 60).round(1)})
+    return _get_barchart(df, 'Minutes', 'User', 'User', 'Minutes')
@@ -0,0 +1,269 @@
+import numpy as np
+
+EMPTY = np.array([], dtype=np.intp)
+
+# message features summed by fetch_stats, kept as running totals by the time index
+WINDOW_COLUMNS = ('word_count', 'is_media', 'url_count')
+
+DAY = np.timedelta64(1, 'D')
+
+
+
+
+class SharedTable:
+    """
+    Tables of a chat built once, and stored in df.attrs under key of every frame
+    they were attached to, they are only used for frames whose row index
+    is the very one they were attached to
+    """
+    key = None
+    owners = ()
+
+    def attach(self, df):
+        self.owners = self.owners + (df.index,)
+        df.attrs[self.key] = self
+        return df
+
+    def covers(self, df):
+        return any(df.index is owner for owner in self.owners)
+
+    def __deepcopy__(self, memo):
+        # pandas copies attrs onto every derived frame, the tables are read-only
+        return self
+
+
+
+
+def attached(df, key, cls=None):
+    """
+    Table stored under key in df.attrs when it covers df, otherwise cls built from df
+    and attached to it, so that every later use of the chat reuses it, or None without cls
+    """
+    table = df.attrs.get(key)
+    if table is not None and table.covers(df):
+        return table
+
+    if cls is None:
+        return None
+
+    table = cls(df)
+    table.attach(df)
+    return table
+
+
+
+
+class UserIndex(SharedTable):
+    """
+    Row positions of each user's messages, built once per chat,
+    and shared by the frames of preprocess, which hold the same rows
+    """
+    key = 'user_index'
+
+    def __init__(self, df):
+        self.positions = df.groupby('id', observed=True, sort=False).indices
+
+
+
+
+def add_user_index(*frames):
+    """
+    Attach one user index to frames, which must have the same rows in the same order
+    """
+    index = UserIndex(frames[0])
+    for df in frames:
+        index.attach(df)
+
+    return frames
+
+
+
+
+def select_user(df, user):
+    """
+    Returns messages of user, taken by position when df carries a user index,
+    otherwise by scanning the id column
+    """
+    index = attached(df, UserIndex.key)
+    if index is None:
+        return df[df.id == user]
+
+    return df.iloc[index.positions.get(user, EMPTY)]
+
+
+
+
+def running_total(values):
+    """
+    Running total of values with a leading zero, the total of values[lo:hi] is total[hi] - total[lo]
+    """
+    total = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=total[1:])
+    return total
+
+
+
+
+class TimeIndex(SharedTable):
+    """
+    Datetimes of a chat's messages in time order, with running totals of the stats
+    of every message and of each user's messages, and of messages per day of week and hour
+    up to each day, so that windows of days are answered by binary searches instead of scans.
+    Built on first use, and shared by the frames it was attached to, like the user index
+    positions: position in time order of each user's messages
+    """
+    key = 'time_index'
+
+    def __init__(self, df):
+        datetimes = df.index.values
+        self.order = None
+        if not df.index.is_monotonic_increasing:
+            self.order = np.argsort(datetimes, kind='stable')
+            datetimes = datetimes[self.order]
+
+        self.datetimes = datetimes
+        ordered = {column: self._ordered(df[column].values) for column in WINDOW_COLUMNS}
+        self.totals = {column: running_total(values) for column, values in ordered.items()}
+
+        # days since the first message as in add_datepart's Elapsed, and text messages
+        # as counted by timeline_stats
+        elapsed = ((datetimes - datetimes[0]) // DAY).astype(np.int64) if len(datetimes) else datetimes
+        is_text = ~(self._ordered(df['is_media'].values) | self._ordered(df['is_deleted'].values))
+        self.elapsed = elapsed
+        self.text_positions = np.flatnonzero(is_text)
+
+        positions = df.groupby('id', observed=True, sort=False).indices
+        if self.order is not None:
+            rank = np.empty(len(self.order), dtype=np.intp)
+            rank[self.order] = np.arange(len(self.order))
+            positions = {user: np.sort(rank[rows]) for user, rows in positions.items()}
+
+        self.positions = positions
+        self.user_totals, self.user_text, self.user_days = {}, {}, {}
+        for user, rows in positions.items():
+            self.user_totals[user] = {column: running_total(values[rows]) for column, values in ordered.items()}
+            text = rows[is_text[rows]]
+            self.user_text[user] = text
+            # running count of text messages sent on a later Elapsed day than the one before
+            self.user_days[user] = running_total(np.diff(elapsed[text], prepend=-1) != 0)
+
+        # messages in each day of week and hour cell, up to each calendar day with messages
+        days = datetimes.astype('datetime64[D]')
+        self.days, day_codes = np.unique(days, return_inverse=True)
+        self.day_starts = np.searchsorted(days, np.append(self.days, days[-1] + DAY) if len(days) else days)
+        hours = (datetimes - days) // np.timedelta64(1, 'h')
+        self.cells = (((days.astype(np.int64) + 3) % 7) * 24 + hours).astype(np.int16)
+        activity = np.bincount(day_codes * 168 + self.cells, minlength=len(self.days) * 168)
+        self.activity = np.zeros((len(self.days) + 1, 168), dtype=np.int32)
+        np.cumsum(activity.reshape(-1, 168), axis=0, out=self.activity[1:])
+
+    def _ordered(self, values):
+        return values if self.order is None else values[self.order]
+
+    def bounds(self, start, end):
+        """
+        Range of days with messages, and of positions in time order,
+        of the messages sent from day start to day end, both included
+        """
+        first = np.searchsorted(self.days, np.datetime64(start, 'D'), side='left')
+        last = max(first, np.searchsorted(self.days, np.datetime64(end, 'D'), side='right'))
+        return (first, last), (self.day_starts[first], self.day_starts[last])
+
+    def rows(self, start, end):
+        """
+        Row positions, or a slice of them, of the messages sent from day start to day end
+        """
+        _, (lo, hi) = self.bounds(start, end)
+        return slice(lo, hi) if self.order is None else self.order[lo:hi]
+
+    def _user_range(self, user, lo, hi):
+        positions = self.positions.get(user, EMPTY)
+        return positions, np.searchsorted(positions, lo), np.searchsorted(positions, hi)
+
+    def stats(self, user, start, end):
+        """
+        Number of messages, words, media files, and links of user sent in the window
+        """
+        _, (lo, hi) = self.bounds(start, end)
+        if user.lower() == 'overall':
+            totals, a, b = self.totals, lo, hi
+        else:
+            _, a, b = self._user_range(user, lo, hi)
+            totals = self.user_totals.get(user)
+            if totals is None:
+                return 0, 0, 0, 0
+
+        word_count, is_media, url_count = (int(totals[column][b] - totals[column][a]) for column in WINDOW_COLUMNS)
+        return int(b - a), word_count, is_media, url_count
+
+    def user_counts(self, start, end):
+        """
+        Number of messages of each user sent in the window
+        """
+        _, (lo, hi) = self.bounds(start, end)
+        return {user: int(np.searchsorted(positions, hi) - np.searchsorted(positions, lo))
+                for user, positions in self.positions.items()}
+
+    def timespan(self, user, start, end):
+        """
+        Text messages of user in the window as timeline_stats counts them: days elapsed
+        from the first message of the chat to the last one of the window for everyone,
+        or days user sent messages on, and the first and last of them, or None without any
+        """
+        _, (lo, hi) = self.bounds(start, end)
+        overall = user.lower() == 'overall'
+        text = self.text_positions if overall else self.user_text.get(user, EMPTY)
+        a, b = np.searchsorted(text, lo), np.searchsorted(text, hi)
+        if a == b:
+            return None
+
+        if overall:
+            total_days = int(self.elapsed[text[b - 1]])
+        else:
+            days = self.user_days[user]
+            total_days = int(1 + days[b] - days[a + 1])
+
+        return total_days, self.datetimes[text[a]], self.datetimes[text[b - 1]]
+
+    def activity_matrix(self, user, start, end):
+        """
+        7x24 matrix of the number of messages of user sent in the window
+        on each day of week, from monday, and hour
+        """
+        (first, last), (lo, hi) = self.bounds(start, end)
+        if user.lower() == 'overall':
+            activity = self.activity[last] - self.activity[first]
+        else:
+            positions, a, b = self._user_range(user, lo, hi)
+            activity = np.bincount(self.cells[positions[a:b]], minlength=168)
+
+        return activity.reshape(7, 24)
+
+
+
+
+def time_index(df, *frames):
+    """
+    Time index of a chat frame indexed by datetime, built on first use and attached to df,
+    and to frames, which must have the same rows in the same order,
+    so that every later window of the chat reuses it
+    """
+    index = attached(df, TimeIndex.key, TimeIndex)
+    for frame in frames:
+        if not index.covers(frame):
+            index.attach(frame)
+
+    return index
+
+
+
+
+def select_window(df, window):
+    """
+    Returns messages of df sent in window, a pair of first and last day, or all of them for None,
+    taken by position from the time index
+    """
+    if window is None:
+        return df
+
+    return df.iloc[time_index(df).rows(*window)]
@@ -0,0 +1,148 @@
+import re
+import logging
+from functools import lru_cache
+from multiprocessing import Pool
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# list of custom stopwords
+stopwords= set(['br', 'the', 'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've",\
+            "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', \
+            'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their',\
+            'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', \
+            'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', \
+            'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', \
+            'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after',\
+            'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further',\
+            'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',\
+            'most', 'other', 'some', 'such', 'only', 'own', 'same', 'so', 'than', 'too', 'very', \
+            's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', \
+            've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn',\
+            "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn',\
+            "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", \
+            'won', "won't", 'wouldn', "wouldn't", 'hi', 'okay', 'ok', 'ohkay', 'bro', 'bye', 'thanks', 'thank', 'yeah', 'ya', \
+            'u', 'ur', ])
+
+
+@lru_cache(maxsize=None)
+def lemmatizer():
+    """
+    Lemmatize function of wordnet, loaded on first use,
+    the corpus is looked up locally and never downloaded, words are kept
+    as they are when it is missing, install it with: python -m nltk.downloader wordnet
+    """
+    import nltk
+    from nltk.stem.wordnet import WordNetLemmatizer
+
+    try:
+        nltk.data.find('corpora/wordnet')
+    except LookupError:
+        logger.warning('wordnet corpus not found, words are not lemmatized')
+        return lambda word: word
+
+    return WordNetLemmatizer().lemmatize
+
+
+# https://stackoverflow.com/a/47091490/4084039
+def decontracted(phrase):
+    # specific
+    phrase = re.sub(r"won't", "will not", phrase)
+    phrase = re.sub(r"can\'t", "can not", phrase)
+
+    # general
+    phrase = re.sub(r"n\'t", " not", phrase)
+    phrase = re.sub(r"\'re", " are", phrase)
+    phrase = re.sub(r"\'s", " is", phrase)
+    phrase = re.sub(r"\'d", " would", phrase)
+    phrase = re.sub(r"\'ll", " will", phrase)
+    phrase = re.sub(r"\'t", " not", phrase)
+    phrase = re.sub(r"\'ve", " have", phrase)
+    phrase = re.sub(r"\'m", " am", phrase)
+    return phrase
+
+
+def preprocess_text(sentence:str):
+    #a. remove html and url tags from text
+    sentence = re.sub(r"http\S+", "", sentence)
+    sentence = BeautifulSoup(sentence, 'lxml').get_text()
+
+    #b.expand contracted terms
+    sentence = decontracted(sentence)
+
+    #c.remove non aplhabet characters
+    sentence = re.sub("\S*\d\S*", "", sentence).strip()
+    sentence = re.sub('[^A-Za-z]+', ' ', sentence)
+
+    #d. lemmatize each word in sentence
+    #e. and turn them into lower case
+    #list of stop words: https://gist.github.com/sebleier/554280
+    lemmatize = lemmatizer()
+    sentence = ' '.join(lemmatize(word.lower()) for word in sentence.
+    split() if word.lower() not in stopwords)
+
+    return sentence
+
+
+# patterns of preprocess_text, compiled once
+URL_PATTERN = re.compile(r"http\S+")
+DIGIT_WORD_PATTERN = re.compile(r"\S*\d\S*")
+NON_ALPHA_PATTERN = re.compile(r"[^A-Za-z]+")
+
+# expansions of decontracted, in the order they were applied. Expansions contain no apostrophe,
+# so a single pass of the alternation, tried in this order, gives the same text
+CONTRACTIONS = {
+    "won't": "will not",
+    "can't": "can not",
+    "n't": " not",
+    "'re": " are",
+    "'s": " is",
+    "'d": " would",
+    "'ll": " will",
+    "'t": " not",
+    "'ve": " have",
+    "'m": " am",
+}
+CONTRACTION_PATTERN = re.compile('|'.join(map(re.escape, CONTRACTIONS)))
+
+# messages are parsed as html only when they may hold tags or entities
+MARKUP_CHARS = ('<', '&')
+
+
+@lru_cache(maxsize=None)
+def normalize_word(word):
+    """
+    Lemma of lower cased word, or an empty string for stopwords,
+    chats repeat few distinct words, so each is lemmatized once
+    """
+    word = word.lower()
+    if word in stopwords:
+        return ''
+
+    return lemmatizer()(word)
+
+
+def normalize_text(sentence):
+    """
+    Same result as preprocess_text, without its per-message overheads
+    """
+    sentence = URL_PATTERN.sub("", sentence)
+    if any(char in sentence for char in MARKUP_CHARS):
+        sentence = BeautifulSoup(sentence, 'lxml').get_text()
+
+    sentence = CONTRACTION_PATTERN.sub(lambda match: CONTRACTIONS[match.group()], sentence)
+    sentence = DIGIT_WORD_PATTERN.sub("", sentence)
+    words = (normalize_word(word) for word in NON_ALPHA_PATTERN.sub(' ', sentence).split())
+    return ' '.join(word for word in words if word)
+
+
+def normalize_texts(messages, processes=1, chunksize=10000):
+    """
+    Normalize list of messages for topic modelling,
+    fanning out over a pool of processes when processes > 1
+    """
+    if processes <= 1 or len(messages) <= chunksize:
+        return [normalize_text(message) for message in messages]
+
+    with Pool(processes) as pool:
+        return pool.map(normalize_text, messages, chunksize)
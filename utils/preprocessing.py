@@ -1,11 +1,152 @@
 
 import pandas as pd
+import numpy as np
+import io
+import os
+import gc
 import re
 import csv
-import fire
+import zipfile
 import warnings
+from collections import Counter, namedtuple
+from contextlib import ExitStack, contextmanager
+from utils.aggregation import DAY_NAMES
+from utils.emojis import emoji_table
+from utils.features import add_message_features
+from utils.indexing import SharedTable, add_user_index
+from utils.profiling import profiled
 warnings.filterwarnings("ignore")
 
+# number of characters read from the upload buffer at a time
+CHUNK_SIZE = 1 << 20
+
+# number of characters sampled from the start of an export to detect its format
+SNIFF_SIZE = 1 << 14
+
+# exported chats larger than this many bytes, once decompressed, are refused
+MAX_CHAT_BYTES = int(os.environ.get('MAX_CHAT_BYTES', 200 << 20))
+
+# zipped exports, which hold the chat and its media files, start with a zip local file header
+ZIP_MAGIC = b'PK\x03\x04'
+
+# loose timestamp covering all export formats, only used on the sample:
+# optional "[", date, time with optional seconds and am/pm, optional "]"
+SNIFF_PATTERN = re.compile(
+    r'^[ \t\u200e]*(\[?)(\d{1,4})([./-])(\d{1,2})\3(\d{2,4}),?[ \t]+'
+    r'\d{1,2}:\d{2}(:\d{2})?([ \t\u202f]*[AaPp]\.?[Mm]\.?)?',
+    re.MULTILINE
+)
+
+# sender names may have unicode letters, emojis and punctuation, just no colon
+NAME = r'[^\r\n:]+'
+
+Dialect = namedtuple('Dialect', [
+    'timestamp_pattern',  # a line starting with a timestamp begins a new message
+    'line_pattern',       # date, time, sender, and message of a line
+    'header_pattern',     # same, with an optional sender to also match notifications
+    'date_format',
+    'time_format',        # applies to times with spaces and dots removed
+])
+
+
+
+
+def make_dialect(ios=False, sep='/', order='dmy', long_year=True, seconds=False, twelve_hour=False):
+    """
+    Precompile patterns, and build fixed datetime formats of an export format
+    ios: "[date, time] name: text" instead of "date, time - name: text"
+    order: order of day, month, and year in dates, one of dmy, mdy, ymd
+    """
+    fields = {'d': r'\d{1,2}', 'm': r'\d{1,2}', 'y': r'\d{4}' if long_year else r'\d{2}'}
+    codes = {'d': '%d', 'm': '%m', 'y': '%Y' if long_year else '%y'}
+    date = re.escape(sep).join(fields[field] for field in order)
+    date_format = sep.join(codes[field] for field in order)
+
+    time = r'\d{1,2}:\d{2}'
+    time_format = '%I:%M' if twelve_hour else '%H:%M'
+    if seconds:
+        time += r':\d{2}'
+        time_format += ':%S'
+    if twelve_hour:
+        time += r'[ \t\u202f]*[AaPp]\.?[Mm]\.?'
+        time_format += '%p'
+
+    if ios:
+        prefix = r'[ \t\u200e]*\[({date}),[ \t]+({time})\][ \t]+'
+    else:
+        prefix = r'[ \t\u200e]*({date}),[ \t]+({time})[ \t]+-[ \t]+'
+
+    timestamp = prefix.replace('(', '(?:').format(date=date, time=time)
+    prefix = prefix.format(date=date, time=time)
+
+    return Dialect(
+        timestamp_pattern=re.compile(timestamp),
+        line_pattern=re.compile('^' + prefix + '(' + NAME + r'):[ \t]+([^\r\n]*)', re.MULTILINE),
+        header_pattern=re.compile('^' + prefix + '(?:(' + NAME + r'):[ \t]+)?([^\r\n]*)', re.MULTILINE),
+        date_format=date_format,
+        time_format=time_format,
+    )
+
+
+# android export with the day before the month, as in data/group_chats.csv
+DEFAULT_DIALECT = make_dialect()
+
+# smallest dtypes that hold the date features of add_datepart
+DATEPART_DTYPES = {
+    'hour': np.int8,
+    'minute': np.int8,
+    'Year': np.int16,
+    'Month': np.int8,
+    'Week': np.int8,
+    'Day': np.int8,
+    'Dayofweek': np.int8,
+    'Dayofyear': np.int16,
+    'Elapsed': np.int32,
+}
+
+# date features add_datepart keeps as columns, those the helpers read,
+# the others are only derived when asked for
+DATEPART_COLUMNS = ('hour', 'Year', 'Month', 'Day', 'Dayofweek', 'Elapsed')
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+
+
+
+def sniff_dialect(sample):
+    """
+    Detect the export format from timestamps in sample, the first few KB of a chat,
+    falls back to DEFAULT_DIALECT when sample has none
+    """
+    matches = SNIFF_PATTERN.findall(sample)
+    if not matches:
+        return DEFAULT_DIALECT
+
+    brackets, firsts, seps, middles, lasts, seconds, ampms = zip(*matches)
+    majority = len(matches) / 2
+
+    # the sample may only hold days up to 12, parse_chat settles the order of day
+    # and month from every date of the export, with resolve_date_order
+    if any(len(first) == 4 for first in firsts):
+        order, year = 'ymd', firsts
+    elif any(int(middle) > 12 for middle in middles):
+        order, year = 'mdy', lasts
+    else:
+        order, year = 'dmy', lasts
+
+    return make_dialect(
+        ios=sum(map(bool, brackets)) > majority,
+        sep=Counter(seps).most_common(1)[0][0],
+        order=order,
+        long_year=all(len(value) == 4 for value in year),
+        seconds=sum(map(bool, seconds)) > majority,
+        twelve_hour=sum(map(bool, ampms)) > majority,
+    )
+
+
+
+
 def separator(msg):
     """
     Extract datetime, person name or number, and message text from msg
@@ -43,55 +184,442 @@ def txt_to_csv(fn):
 
 
 
+class ExportTooLarge(ValueError):
+    """
+    Exported chat is larger than MAX_CHAT_BYTES
+    """
+
+
+
+
+def find_chat_member(archive):
+    """
+    Chat text file of a zipped export, named "_chat.txt" by ios and "WhatsApp Chat with <name>.txt"
+    by android, otherwise the largest text file, as documents shared in the chat can be text files too
+    """
+    members = [info for info in archive.infolist()
+               if not info.filename.endswith('/') and info.filename.lower().endswith('.txt')]
+    if not members:
+        raise ValueError('zip file holds no exported chat')
+
+    def rank(info):
+        name = os.path.basename(info.filename)
+        return name == '_chat.txt' or name.startswith('WhatsApp Chat'), info.file_size
+
+    return max(members, key=rank)
+
+
+
+
+@contextmanager
+def open_chat(buffer):
+    """
+    Binary stream of the chat in buffer, an exported text file or a zipped export,
+    of which only the chat is decompressed, as it is read, and media files are skipped
+    Raises ExportTooLarge for chats of more than MAX_CHAT_BYTES
+    """
+    start = buffer.tell()
+    is_zip = buffer.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+    size = buffer.seek(0, io.SEEK_END) - start
+    buffer.seek(start)
+
+    if not is_zip:
+        if size > MAX_CHAT_BYTES:
+            raise ExportTooLarge(f'Exported chat is larger than {MAX_CHAT_BYTES >> 20} MB')
+        yield buffer
+        return
+
+    with zipfile.ZipFile(buffer) as archive:
+        # members are never read past their declared size, so it bounds what is decompressed
+        info = find_chat_member(archive)
+        if info.file_size > MAX_CHAT_BYTES:
+            raise ExportTooLarge(f'Exported chat is larger than {MAX_CHAT_BYTES >> 20} MB')
+
+        with archive.open(info) as member:
+            yield member
+
+
+
+
+@contextmanager
+def open_text(source):
+    """
+    Open source as a text stream, source can be a file name,
+    a text stream, or a binary buffer such as streamlit's UploadedFile,
+    files and buffers can hold a text export or a zipped one
+    """
+    if isinstance(source, io.TextIOBase):
+        yield source
+        return
+
+    with ExitStack() as stack:
+        buffer = source if hasattr(source, 'read') else stack.enter_context(open(source, 'rb'))
+        stream = io.TextIOWrapper(stack.enter_context(open_chat(buffer)),
+                                  encoding='utf-8', errors='replace', newline='')
+        try:
+            yield stream
+        finally:
+            # leave the caller's buffer open
+            stream.detach()
+
+
+
+
+def read_chunks(stream, chunk_size=CHUNK_SIZE, head=''):
+    """
+    Read stream in blocks of complete lines,
+    a partial last line is carried over to the next block
+    head: text already read from the stream
+    """
+    tail = head
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        chunk = tail + chunk
+        end = chunk.rfind('\n') + 1
+        tail = chunk[end:]
+        if end:
+            yield chunk[:end]
+
+    if tail:
+        yield tail
+
+
+
+
+def resolve_date_order(dialect, dates):
+    """
+    Dialect with the order of day and month decided by dates, the distinct dates of an export
+    in the order they first appear: the field that goes above 12 is the day. Exports whose days
+    never go above 12 take the order that keeps their dates in time order over the shortest span
+    """
+    if not dialect.date_format.startswith(('%d', '%m')) or not len(dates):
+        return dialect
+
+    fields = pd.Series(dates, dtype=object).str.extract(r'^\D*(\d+)\D+(\d+)').astype(np.int64)
+    swapped = dialect.date_format.replace('%d', '\0').replace('%m', '%d').replace('\0', '%m')
+    day_first = dialect.date_format.startswith('%d')
+
+    if fields[0].max() > 12:
+        date_format = dialect.date_format if day_first else swapped
+    elif fields[1].max() > 12:
+        date_format = swapped if day_first else dialect.date_format
+    else:
+        def misfit(date_format):
+            days = pd.to_datetime(pd.Series(dates, dtype=object), format=date_format).values
+            return bool((np.diff(days) < np.timedelta64(0)).any()), days.max() - days.min()
+
+        # ties keep the sniffed order
+        date_format = min([dialect.date_format, swapped], key=misfit)
+
+    return dialect._replace(date_format=date_format)
+
+
+
+
+def parse_dates(dates, dialect=DEFAULT_DIALECT):
+    """
+    Parse date strings into datetime64 values,
+    each distinct date is parsed only once with a fixed format
+    """
+    date_codes, unique_dates = pd.factorize(pd.Series(dates, dtype=object))
+    return pd.to_datetime(pd.Series(unique_dates), format=dialect.date_format).values[date_codes]
+
+
+
 
-def add_datepart(df, fieldname):
+def parse_times(times, dialect=DEFAULT_DIALECT):
+    """
+    Parse time of day strings into timedelta64 values since midnight,
+    each distinct time is parsed only once with a fixed format
+    """
+    time_codes, unique_times = pd.factorize(pd.Series(times, dtype=object))
+
+    # "11:16 a.m." and "11:16\u202fAM" both become "11:16am"
+    unique_times = pd.Series(unique_times).str.replace(r'[\s.]', '', regex=True)
+
+    unique_times = (pd.to_datetime(unique_times, format=dialect.time_format)
+                    - pd.Timestamp('1900-01-01')).values
+
+    return unique_times[time_codes]
+
+
+
+
+def parse_datetimes(dates, times, dialect=DEFAULT_DIALECT):
+    """
+    Combine date and time strings into datetime64 values,
+    each distinct date and time of day is parsed only once with a fixed format
+    """
+    return parse_dates(dates, dialect) + parse_times(times, dialect)
+
+
+
+
+def read_message_blocks(stream, chunk_size=CHUNK_SIZE, head='', dialect=DEFAULT_DIALECT):
+    """
+    Read stream in blocks of complete messages, the last message
+    of a block is carried over as its continuation lines may be in the next block
+    """
+    tail = ''
+    for chunk in read_chunks(stream, chunk_size, head):
+        chunk = tail + chunk
+
+        # walk back over line starts until one begins a message
+        start = len(chunk)
+        while start > 0:
+            start = chunk.rfind('\n', 0, start - 1) + 1
+            if dialect.timestamp_pattern.match(chunk, start):
+                break
+
+        tail = chunk[start:]
+        if start:
+            yield chunk[:start]
+
+    if tail:
+        yield tail
+
+
+
+
+def split_lines(block, dialect=DEFAULT_DIALECT):
+    """
+    Extract date, time, id, and message columns from block,
+    dropping every line that does not start a message
+    """
+    return tuple(zip(*dialect.line_pattern.findall(block))) or ((), (), (), ())
+
+
+
+
+def split_messages(block, dialect=DEFAULT_DIALECT):
+    """
+    Extract date, time, id, and message columns from block,
+    continuation lines are joined onto the message they belong to
+    """
+    block = block.replace('\r\n', '\n')
+    if block.endswith('\n'):
+        block = block[:-1]
+
+    # classify all lines at once, every message start opens a new group
+    lines = pd.Series(block.split('\n'), dtype=object)
+    is_header = lines.str.match(dialect.timestamp_pattern).values.astype(bool)
+    group = np.cumsum(is_header)
+
+    headers = dialect.header_pattern.findall('\n'.join(lines[is_header]))
+    if not headers:
+        return (), (), (), ()
+
+    dates, times, ids, messages = (np.array(column, dtype=object) for column in zip(*headers))
+
+    # lines before the first message have nothing to continue
+    is_continuation = ~is_header & (group > 0)
+    if is_continuation.any():
+        # lines of a group are contiguous in the block, so a message with its
+        # continuation lines is a single slice between two line offsets
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum(lines.str.len().values + 1, out=offsets[1:])
+
+        first_line = np.flatnonzero(is_header)
+        last_line = np.append(first_line[1:], len(lines)) - 1
+        multiline = np.flatnonzero(last_line > first_line)
+
+        lengths = np.fromiter(map(len, messages[multiline]), dtype=np.int64, count=len(multiline))
+        starts = offsets[first_line[multiline] + 1] - 1 - lengths
+        ends = offsets[last_line[multiline] + 1] - 1
+        messages[multiline] = [block[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+    # notifications have no sender
+    is_message = ids != ''
+    return dates[is_message], times[is_message], ids[is_message], messages[is_message]
+
+
+
+
+@contextmanager
+def gc_paused():
+    """
+    Pause the cyclic garbage collector, which would otherwise rescan
+    the millions of tuples findall allocates without freeing any of them
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+
+
+def parse_chat(source, chunk_size=CHUNK_SIZE, multiline=True, dialect=None):
+    """
+    Parse exported chats in a single streaming pass,
+    returns dataframe with datetime, id, and message columns
+    source: file name or buffer
+    multiline: keep lines that continue a message, otherwise they are dropped
+    dialect: export format, detected from the start of source by default,
+    with the order of day and month decided by every date of source
+    The date format the dates were parsed with is kept in attrs['date_format']
+    """
+    date_codes, times, ids, messages = [], [], [], []
+
+    # distinct dates of the whole export, numbered in the order they first appear
+    dates_seen = {}
+
+    with open_text(source) as stream, gc_paused():
+        head = stream.read(SNIFF_SIZE)
+        sniffed = dialect is None
+        if sniffed:
+            dialect = sniff_dialect(head)
+
+        if multiline:
+            blocks = read_message_blocks(stream, chunk_size, head, dialect)
+            blocks = (split_messages(block, dialect) for block in blocks)
+        else:
+            blocks = (split_lines(block, dialect) for block in read_chunks(stream, chunk_size, head))
+
+        for dates, block_times, block_ids, block_messages in blocks:
+            if not len(dates):
+                continue
+
+            # times are parsed per block, dates once the order of day and month is known,
+            # only their codes and the distinct dates are kept around
+            codes, unique_dates = pd.factorize(pd.Series(dates, dtype=object))
+            numbers = [dates_seen.setdefault(date, len(dates_seen)) for date in unique_dates]
+            date_codes.append(np.array(numbers, dtype=np.int64)[codes])
+            times.append(parse_times(block_times, dialect))
+            ids.extend(block_ids)
+            messages.extend(block_messages)
+
+    if sniffed:
+        dialect = resolve_date_order(dialect, list(dates_seen))
+
+    datetimes = np.array([], dtype='datetime64[ns]')
+    if date_codes:
+        datetimes = parse_dates(list(dates_seen), dialect)[np.concatenate(date_codes)] + np.concatenate(times)
+
+    df = pd.DataFrame({
+        'datetime': datetimes,
+        'id': pd.Series(ids, dtype=object),
+        'message': pd.Series(messages, dtype=object),
+    })
+    df.attrs['date_format'] = dialect.date_format
+    return df
+
+
+
+
+def date_features(field, names):
+    """
+    Date features names of datetime series field, as arrays of DATEPART_DTYPES,
+    of any datetime resolution, pandas 2 and later keep datetimes in microseconds
+    """
+    datetimes = field.values.astype('datetime64[ns]')
+    dates = datetimes.astype('datetime64[D]')
+    since_midnight = datetimes - dates
+
+    # features of the day are computed once per distinct day, most messages share their day
+    day_codes, days = pd.factorize(dates)
+    days = pd.DatetimeIndex(days)
+
+    features = {
+        'hour': lambda: since_midnight // np.timedelta64(1, 'h'),
+        'minute': lambda: since_midnight // np.timedelta64(1, 'm') % 60,
+        'Year': lambda: days.year.values[day_codes],
+        'Month': lambda: days.month.values[day_codes],
+        'Week': lambda: days.isocalendar().week.values.astype(np.int64)[day_codes],
+        'Day': lambda: days.day.values[day_codes],
+        'Dayofweek': lambda: days.dayofweek.values[day_codes],
+        'Dayofyear': lambda: days.dayofyear.values[day_codes],
+        'Elapsed': lambda: (datetimes - datetimes.min()) // np.timedelta64(1, 'D') if len(datetimes) else day_codes,
+        'MonthName': lambda: pd.Categorical.from_codes(days.month.values[day_codes] - 1, categories=MONTH_NAMES),
+        'DayName': lambda: pd.Categorical.from_codes(days.dayofweek.values[day_codes], categories=DAY_NAMES),
+    }
+    values = {name: features[name]() for name in names}
+    return {name: column.astype(DATEPART_DTYPES[name]) if name in DATEPART_DTYPES else column
+            for name, column in values.items()}
+
+
+
+
+def add_datepart(df, fieldname, names=DATEPART_COLUMNS):
     """
     Adds date related features to dataframe df inplace
     df: dataframe
-    fieldname: name of the date field in df
+    fieldname: name of the date field in df, a column, which is dropped, or the index
+    names: features added as columns, the others are derived on demand by date_feature
     """
-    new_df = df.copy()
-    field = df[fieldname]
+    field = df[fieldname] if fieldname in df.columns else df.index.to_series()
     target_prefix = re.sub('[Dd]atetime$', '', fieldname)
-    
-    date_features = (
-         'hour',
-         'minute',
-         'Year', 
-         'Month', 
-         'Week', 
-         'Day', 
-         'Dayofweek', 
-         'Dayofyear', 
-    )
-    
-    for name in date_features:
-        new_df[target_prefix+name] = getattr(field.dt, name.lower())
-        
-    new_df[target_prefix+'Elapsed'] = (field - field.min()).dt.days
-    new_df[target_prefix+'MonthName'] = field.dt.month_name()
-    new_df[target_prefix+'DayName'] = field.dt.day_name()
-    new_df.drop(fieldname, axis=1, inplace=True)
 
-    return new_df
+    for name, values in date_features(field, names).items():
+        df[target_prefix+name] = values
+
+    if fieldname in df.columns:
+        df.drop(fieldname, axis=1, inplace=True)
+
+    return df
+
+
+
 
+def date_feature(df, name):
+    """
+    Date feature name of a frame indexed by datetime, its column when add_datepart added it,
+    otherwise derived from the index, Elapsed then counts days from the first row of df
+    """
+    if name in df.columns:
+        return df[name]
+
+    return pd.Series(date_features(df.index.to_series(), [name])[name], index=df.index, name=name)
 
 
 
-def preprocess(fn:str) -> pd.DataFrame:
+
+@profiled
+def preprocess(fn) -> pd.DataFrame:
     """
-    Preprocess whatsapp text file
+    Preprocess whatsapp text file,
+    fn can be a file name or an uploaded file buffer
     """
-    txt_to_csv(fn)
-    chats_df = pd.read_csv(f'{fn[:-4]}.csv', parse_dates=['datetime'])
-    chats = chats_df.set_index('datetime')
+    return build_frames(add_message_features(parse_chat(fn)))
+
+
+
+
+def build_frames(chats_df):
+    """
+    Frames used by the helpers, from parsed chats with message features,
+    indexed by datetime, and with date features
+    chats_df itself becomes the first frame
+    """
+    # the emoji table, and tables chats_df came with, such as the counts of the store,
+    # follow its rows to both frames
+    emoji_table(chats_df)
+    tables = [table for table in chats_df.attrs.values()
+              if isinstance(table, SharedTable) and table.covers(chats_df)]
+    chats_df.set_index('datetime', inplace=True)
+    chats = chats_df
+
+    # a shallow copy shares the columns of chats, message text included,
+    # only the date features are new
+    chats_with_features = add_datepart(chats.copy(deep=False), 'datetime')
 
-    chats_with_features = add_datepart(chats_df, 'datetime')
+    # both frames keep the rows of chats_df in order, and share one user index and emoji table
+    add_user_index(chats, chats_with_features)
+    for table in tables:
+        table.attach(chats)
+        table.attach(chats_with_features)
 
     return chats, chats_with_features
 
 if __name__ == '__main__':
+    # many exports are analysed with python -m utils.batch
     import sys
-    if sys.argv:
-        chats_df = preprocess(sys.argv[1])
-        print(chats_df.head(5))
+    if len(sys.argv) > 1:
+        chats, _ = preprocess(sys.argv[1])
+        print(chats.head(5))
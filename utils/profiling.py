@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+# peak memory is traced with tracemalloc, which slows every allocation, so it is off unless asked for
+PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', '') not in ('', '0')
+
+# one json line per profiled call, to PROFILE_LOG if set, otherwise to stderr
+PROFILE_LOG = os.environ.get('PROFILE_LOG')
+logger = logging.getLogger('whatsapp_chat_analysis.profiling')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    handler = logging.FileHandler(PROFILE_LOG) if PROFILE_LOG else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+# records collected by each thread, that is by each streamlit session
+_local = threading.local()
+
+# tracemalloc counts allocations of all threads, so peaks are shared by the calls
+# in progress of every thread, peaks include allocations of sessions running meanwhile
+_memory_lock = threading.Lock()
+_memory = {'frames': []}
+
+# python before 3.9 can only reset the peak along with every trace, which hides frees of the
+# blocks traced before, there only calls starting while no call is traced get a peak
+RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+
+
+
+def _checkpoint():
+    """
+    Fold the peak traced since the last checkpoint into every call in progress,
+    and start tracing a new peak
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    for frame in _memory['frames']:
+        frame['peak'] = max(frame['peak'], peak)
+
+    if RESET_PEAK:
+        tracemalloc.reset_peak()
+
+    return current
+
+
+
+
+def count_rows(*values):
+    """
+    Rows of the first dataframe, series, or list among values, or in a tuple among them
+    """
+    for value in values:
+        if isinstance(value, (pd.DataFrame, pd.Series, list)):
+            return len(value)
+        if isinstance(value, tuple):
+            rows = count_rows(*value)
+            if rows is not None:
+                return rows
+
+    return None
+
+
+
+
+@contextmanager
+def profile(name, rows=None):
+    """
+    Record wall time, cpu time of this thread, and peak memory allocated meanwhile
+    when PROFILE_MEMORY is set, of the with block as a call of name,
+    the peak is None for calls within another traced call on python before 3.9
+    Yields the record, whose rows can be set in the block
+    """
+    record = {'name': name, 'rows': rows}
+    frame = {'peak': 0}
+    if PROFILE_MEMORY:
+        with _memory_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if RESET_PEAK or not _memory['frames']:
+                if not RESET_PEAK:
+                    tracemalloc.clear_traces()
+                frame['base'] = frame['peak'] = _checkpoint()
+                _memory['frames'].append(frame)
+
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+        record['error'] = None
+
+    except BaseException as exc:
+        record['error'] = type(exc).__name__
+        raise
+
+    finally:
+        record['wall_s'] = time.perf_counter() - start
+        record['cpu_s'] = time.thread_time() - cpu_start
+        record['peak_mb'] = None
+        if 'base' in frame:
+            with _memory_lock:
+                _checkpoint()
+                _memory['frames'].remove(frame)
+            record['peak_mb'] = (frame['peak'] - frame['base']) / 1024 ** 2
+
+        record.update(time=time.time(), pid=os.getpid(), thread=threading.current_thread().name)
+        for records in getattr(_local, 'collectors', []):
+            records.append(record)
+        logger.info(json.dumps(record))
+
+
+
+
+def profiled(fn):
+    """
+    Decorator profiling every call of fn, rows are those of the
+    first dataframe among its arguments, or else of its result
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with profile(fn.__name__, count_rows(*args, *kwargs.values())) as record:
+            result = fn(*args, **kwargs)
+            if record['rows'] is None:
+                record['rows'] = count_rows(result)
+            return result
+
+    return wrapper
+
+
+
+
+@contextmanager
+def collect():
+    """
+    Collect the records of calls profiled by this thread in the with block,
+    such as those of one run of the app
+    """
+    records = []
+    if not hasattr(_local, 'collectors'):
+        _local.collectors = []
+    _local.collectors.append(records)
+    try:
+        yield records
+    finally:
+        _local.collectors.pop()
+
+
+
+
+def summary(records):
+    """
+    Dataframe of records, one row per call, in the order calls finished
+    """
+    columns = ['name', 'wall_s', 'cpu_s', 'peak_mb', 'rows', 'error']
+    return pd.DataFrame([{column: record.get(column) for column in columns} for record in records],
+                        columns=columns)
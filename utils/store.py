@@ -0,0 +1,213 @@
+import os
+import io
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from utils.aggregation import MessageCounts
+from utils.cache import DiskCache
+from utils.emojis import EmojiTable, emoji_table
+from utils.features import add_message_features
+from utils.preprocessing import SNIFF_SIZE, build_frames, open_text, parse_chat, parse_datetimes, sniff_dialect
+from utils.profiling import profiled
+from utils.words import WordTable, word_table
+
+# parsed chats are kept here, one directory per chat, the least recently
+# updated chats are removed once they take more than STORE_BYTES
+STORE_DIR = os.environ.get(
+    'CHAT_STORE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'whatsapp-chat-analysis', 'chats'))
+STORE_BYTES = int(os.environ.get('CHAT_STORE_BYTES', 2 << 30))
+
+# columns of parse_chat and add_message_features written to the store
+STORED_COLUMNS = ['datetime', 'id', 'message', 'is_media', 'is_deleted', 'word_count', 'url_count', 'emoji_count']
+
+# sessions uploading the same chat at once take turns
+store_lock = threading.Lock()
+
+
+
+
+def chat_key(text, dialect):
+    """
+    Key of the chat an export belongs to, every later export
+    of a chat starts with the same first message. Exports that leave out the oldest
+    messages, as exports of the last messages only do, start another store
+    """
+    match = dialect.header_pattern.search(text)
+    first = match.group(0) if match else text[:SNIFF_SIZE]
+    return hashlib.blake2b(first.encode('utf-8', errors='replace'), digest_size=16).hexdigest()
+
+
+
+
+def find_tail(text, since, dialect):
+    """
+    Position in text of the first message sent at or after since,
+    found by bisecting text, since messages are exported in the order they were sent
+    """
+    def header_time(match):
+        date, time = match.group(1), match.group(2)
+        return parse_datetimes([date], [time], dialect)[0]
+
+    # headers starting before lo are older than since,
+    # the first header starting at or after hi is not
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        match = dialect.header_pattern.search(text, mid)
+        if match is None or match.start() >= hi or header_time(match) >= since:
+            hi = mid
+        else:
+            lo = match.end()
+
+    match = dialect.header_pattern.search(text, lo)
+    return match.start() if match else len(text)
+
+
+
+
+class ChatStore:
+    """
+    Parsed messages of a chat kept on disk as one parquet part per upload that added messages,
+    with the emojis found in them, and the counts of their users, days, and words,
+    so that none of them is looked for again in later uploads
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'state.json')
+        self.meta = {'parts': 0, 'rows': 0, 'last_datetime': None, 'last_count': 0}
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.meta = json.load(f)['meta']
+
+    def _save(self):
+        # parts not listed in the state are overwritten by the next append,
+        # and the state is replaced at once, so a crash loses at most the last upload
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'meta': self.meta}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def _path(self, kind, idx):
+        return os.path.join(self.directory, f'{kind}-{idx:05d}.parquet')
+
+    def _read(self, kind):
+        """
+        Frames of kind of every part in one frame, or None for stores written before kind was kept
+        """
+        paths = [self._path(kind, idx) for idx in range(self.meta['parts'])]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+
+        frame = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        frame['id'] = frame['id'].astype(object).astype('category')
+        return frame
+
+    def append(self, text, dialect):
+        """
+        Parse the messages of export text that are not stored yet, and store them
+        Returns number of new messages
+        """
+        since = self.meta['last_datetime']
+        if since is None:
+            # the first export settles the order of day and month from all of its dates
+            df = parse_chat(io.StringIO(text))
+            date_format = df.attrs['date_format']
+
+        else:
+            date_format = self.meta.get('date_format', dialect.date_format)
+            dialect = dialect._replace(date_format=date_format)
+            # the export repeats the stored messages, only its tail from the minute
+            # of the last stored message on is parsed, where stored messages come first
+            since = np.datetime64(since)
+            df = parse_chat(io.StringIO(text[find_tail(text, since, dialect):]), dialect=dialect)
+            repeated = min(self.meta['last_count'], int((df['datetime'].values == since).sum()))
+            df = df.iloc[repeated:].reset_index(drop=True)
+
+        if not len(df):
+            return 0
+
+        df = add_message_features(df)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # a new frame of the columns, the attrs of df hold indexes that are not stored
+        part = pd.DataFrame({column: df[column].values for column in STORED_COLUMNS})
+        idx = self.meta['parts']
+        part.to_parquet(self._path('part', idx), index=False)
+        emoji_table(df).occurrences.to_parquet(self._path('emojis', idx), index=False)
+
+        counts = MessageCounts(df)
+        counts.by_user.rename('count').reset_index().to_parquet(self._path('users', idx), index=False)
+        counts.by_day.rename('count').reset_index().to_parquet(self._path('days', idx), index=False)
+        word_table(df).by_user.rename('count').reset_index().to_parquet(self._path('words', idx), index=False)
+
+        last = df['datetime'].values[-1]
+        last_count = int((df['datetime'].values == last).sum())
+        if since is not None and last == since:
+            last_count += self.meta['last_count']
+
+        self.meta = {
+            'parts': self.meta['parts'] + 1,
+            'rows': self.meta['rows'] + len(df),
+            'last_datetime': str(last),
+            'last_count': last_count,
+            'date_format': date_format,
+        }
+        self._save()
+        return len(df)
+
+    def load(self):
+        """
+        All stored messages, with their message features, and the emoji table, counts,
+        and word table of the stored parts merged and attached
+        """
+        if not self.meta['parts']:
+            return pd.DataFrame({column: [] for column in STORED_COLUMNS})
+
+        df = pd.concat([pd.read_parquet(self._path('part', idx)) for idx in range(self.meta['parts'])],
+                       ignore_index=True)
+        df['id'] = df['id'].astype(object).astype('category')
+
+        # stores written before a kind was kept have it computed again from every message
+        occurrences = self._read('emojis')
+        if occurrences is not None:
+            EmojiTable.from_occurrences(occurrences, df['emoji_count'].values).attach(df)
+
+        users, days = self._read('users'), self._read('days')
+        if users is not None and days is not None:
+            MessageCounts.from_counts(users.set_index('id')['count'],
+                                      days.set_index(['id', 'day'])['count']).attach(df)
+
+        words = self._read('words')
+        if words is not None:
+            WordTable.from_counts(words).attach(df)
+
+        return df
+
+
+
+
+@profiled
+def preprocess_incremental(fn, store_dir=STORE_DIR):
+    """
+    Preprocess whatsapp text file like preprocess, keeping the parsed chat in a store,
+    so an export of a chat seen before only has its new messages parsed
+    fn can be a file name or an uploaded file buffer
+    """
+    with open_text(fn) as stream:
+        text = stream.read()
+
+    dialect = sniff_dialect(text[:SNIFF_SIZE])
+    stores = DiskCache(store_dir, STORE_BYTES)
+    key = chat_key(text, dialect)
+    with store_lock:
+        # marks the chat as recently used
+        stores.get(key)
+        store = ChatStore(stores.path(key))
+        store.append(text, dialect)
+        chats_df = store.load()
+        stores.evict(keep=key)
+
+    return build_frames(chats_df)
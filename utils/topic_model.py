@@ -1,100 +1,217 @@
-from top2vec import Top2Vec
-import re
-from bs4 import BeautifulSoup
-from nltk.stem.wordnet import WordNetLemmatizer
-import nltk
-from wordcloud import WordCloud
-
-nltk.download('wordnet')
-
-global wnl
-wnl = WordNetLemmatizer()
-
-# list of custom stopwords
-stopwords= set(['br', 'the', 'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've",\
-            "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', \
-            'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their',\
-            'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', \
-            'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', \
-            'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', \
-            'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after',\
-            'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further',\
-            'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',\
-            'most', 'other', 'some', 'such', 'only', 'own', 'same', 'so', 'than', 'too', 'very', \
-            's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', \
-            've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn',\
-            "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn',\
-            "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", \
-            'won', "won't", 'wouldn', "wouldn't", 'hi', 'okay', 'ok', 'ohkay', 'bro', 'bye', 'thanks', 'thank', 'yeah', 'ya', \
-            'u', 'ur', ])
-
-
-# https://stackoverflow.com/a/47091490/4084039
-def decontracted(phrase):
-    # specific
-    phrase = re.sub(r"won't", "will not", phrase)
-    phrase = re.sub(r"can\'t", "can not", phrase)
-
-    # general
-    phrase = re.sub(r"n\'t", " not", phrase)
-    phrase = re.sub(r"\'re", " are", phrase)
-    phrase = re.sub(r"\'s", " is", phrase)
-    phrase = re.sub(r"\'d", " would", phrase)
-    phrase = re.sub(r"\'ll", " will", phrase)
-    phrase = re.sub(r"\'t", " not", phrase)
-    phrase = re.sub(r"\'ve", " have", phrase)
-    phrase = re.sub(r"\'m", " am", phrase)
-    return phrase
-
-
-def preprocess_text(sentence:str):
-    #a. remove html and url tags from text
-    sentence = re.sub(r"http\S+", "", sentence)
-    sentence = BeautifulSoup(sentence, 'lxml').get_text()
-
-    #b.expand contracted terms
-    sentence = decontracted(sentence)
-
-    #c.remove non aplhabet characters
-    sentence = re.sub("\S*\d\S*", "", sentence).strip()
-    sentence = re.sub('[^A-Za-z]+', ' ', sentence)
-
-    #d. lemmatize each word in sentence
-    #e. and turn them into lower case
-    #list of stop words: https://gist.github.com/sebleier/554280
-    sentence = ' '.join(wnl.lemmatize(word.lower()) for word in sentence.
-    split() if word.lower() not in stopwords)
-
-    return sentence
-
-def get_topics(df):
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from utils.cache import DiskCache
+from utils.normalize import normalize_texts
+from utils.profiling import profiled
+from utils.words import SEPARATOR, cloud_png
+
+# trained models and their topic words are kept on disk, so that
+# analysing the same chat again doesn't train a new model
+TOPIC_CACHE_DIR = os.environ.get(
+    'TOPIC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'whatsapp-chat-analysis', 'topics'))
+TOPIC_CACHE_BYTES = int(os.environ.get('TOPIC_CACHE_BYTES', 2 << 30))
+topic_cache = DiskCache(TOPIC_CACHE_DIR, TOPIC_CACHE_BYTES)
+
+# parameters that change the trained model, part of the cache key
+TOPIC_PARAMS = {'speed': 'learn'}
+NUM_TOPICS = 2
+
+# top2vec learns doc2vec, umap, and hdbscan models of every message, and takes minutes,
+# nmf factorizes tf-idf of distinct conversation windows in seconds
+TOPIC_ENGINES = ('top2vec', 'nmf')
+TOPIC_ENGINE = os.environ.get('TOPIC_ENGINE', 'top2vec')
+
+# documents of the nmf engine are the messages of a user in a window of this length
+TOPIC_WINDOW = os.environ.get('TOPIC_WINDOW', '1H')
+
+# parameters of the nmf engine, part of the cache key: topics learnt, of which NUM_TOPICS
+# most used are shown, words of the vocabulary, and words kept per topic as top2vec does
+NMF_PARAMS = {'engine': 'nmf', 'window': TOPIC_WINDOW, 'components': 10, 'features': 20000,
+              'batch_size': 2048, 'words': 50}
+
+# models are trained by a pool of TOPIC_WORKERS processes shared by all sessions,
+# each training with an equal share of the cores
+TOPIC_WORKERS = int(os.environ.get('TOPIC_WORKERS', 1))
+TOPIC_THREADS = max(1, (os.cpu_count() or 1) // TOPIC_WORKERS)
+
+
+def fingerprint(documents, params, weights=None):
     """
-    Preprocesses conversations to prepare it for Topic modelling
-    Returns list of wordclouds of top two topics
+    Key of a model trained with params on documents, each occurring weights times if given
     """
+    digest = hashlib.blake2b(repr(sorted(params.items())).encode(), digest_size=16)
+    for document in documents:
+        digest.update(document.encode())
+        digest.update(b'\0')
+    if weights is not None:
+        digest.update(np.asarray(weights, dtype=np.int64).tobytes())
+    return digest.hexdigest()
 
-    df = df[df.message != '<Media omitted>']
-    df = df[df.message != 'This message was deleted']
 
-    documents = df['message'].apply(preprocess_text)
-    model = Top2Vec(documents=documents.tolist(), speed="learn", workers=-1)
+def save_topics(topic_words, path):
+    """
+    Save topic words under directory path, which is created
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'topics.json'), 'w') as f:
+        json.dump([list(words) for words in topic_words], f)
 
-    num_topics = model.get_num_topics()
-    if num_topics >= 2:
-        topic_words, word_scores, topic_nums = model.get_topics(2)
 
-    elif num_topics == 1:
-        topic_words, word_scores, topic_nums = model.get_topics(1)
-    
-    else:
+def train_topics(documents, path):
+    """
+    Train a model on documents, and save it with its top topic words under directory path
+    """
+    from top2vec import Top2Vec
+
+    model = Top2Vec(documents=documents, workers=TOPIC_THREADS, **TOPIC_PARAMS)
+    num_topics = min(model.get_num_topics(), NUM_TOPICS)
+    topic_words = []
+    if num_topics:
+        topic_words, word_scores, topic_nums = model.get_topics(num_topics)
+
+    os.makedirs(path)
+    model.save(os.path.join(path, 'model'))
+    save_topics(topic_words, path)
+
+    del model
+
+
+def weighted_documents(messages):
+    """
+    Distinct non-empty normalized documents of messages, and the number of messages
+    of each, chats repeat short messages, which are normalized and learnt once
+    """
+    codes, uniques = pd.factorize(pd.Series(messages, dtype=object))
+    normalized = np.array(normalize_texts(list(uniques)), dtype=object)
+    codes, documents = pd.factorize(normalized[codes])
+    weights = np.bincount(codes, minlength=len(documents))
+
+    kept = documents != ''
+    return list(documents[kept]), weights[kept]
+
+
+def nmf_topics(documents, weights):
+    """
+    Topic words of documents, each occurring weights times, by non-negative factorization
+    of their tf-idf, the topics used most first
+    """
+    from scipy import sparse
+    from sklearn import decomposition
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.preprocessing import normalize
+
+    if not documents:
+        return []
+
+    vectorizer = CountVectorizer(max_features=NMF_PARAMS['features'], dtype=np.float32)
+    try:
+        counts = vectorizer.fit_transform(documents)
+    except ValueError:
+        # no document has a word of two or more letters
         return []
 
+    # smoothed idf of TfidfTransformer, with document frequencies counting every occurrence
+    weights = weights.astype(np.float32)
+    frequencies = (counts > 0).T.astype(np.float32) @ weights
+    idf = np.log((1 + weights.sum()) / (1 + frequencies)) + 1
+    tfidf = normalize(counts @ sparse.diags(idf.astype(np.float32)))
+
+    # a document occurring w times weighs as w copies of it in the frobenius loss of nmf
+    tfidf = sparse.diags(np.sqrt(weights)) @ tfidf
+
+    components = min(NMF_PARAMS['components'], *tfidf.shape)
+    if hasattr(decomposition, 'MiniBatchNMF'):
+        model = decomposition.MiniBatchNMF(components, init='nndsvda', batch_size=NMF_PARAMS['batch_size'],
+                                           random_state=0)
+    else:
+        # scikit-learn before 1.1, coordinate descent on the sparse matrix
+        model = decomposition.NMF(components, init='nndsvda', random_state=0)
+
+    usage = model.fit_transform(tfidf).sum(axis=0)
+    words = np.asarray(vectorizer.get_feature_names_out() if hasattr(vectorizer, 'get_feature_names_out')
+                       else vectorizer.get_feature_names())
+
+    topic_words = []
+    for topic in np.argsort(-usage, kind='stable')[:NUM_TOPICS]:
+        scores = model.components_[topic]
+        top = np.argsort(-scores, kind='stable')[:NMF_PARAMS['words']]
+        top = top[scores[top] > 0]
+        if len(top):
+            topic_words.append(words[top].tolist())
+
+    return topic_words
+
+
+def topic_messages(df, engine='top2vec'):
+    """
+    Text messages of df, the input of topic modelling, or for the nmf engine
+    the messages of each user in each window of TOPIC_WINDOW, joined,
+    short messages say little on their own
+    """
+    df = df[~(df.is_media | df.is_deleted)]
+    if engine != 'nmf' or df.empty:
+        return df.message.tolist()
+
+    # messages are sorted by window in order of first message, stable within each,
+    # and joined at once, windows are split at a separator ending the last message of each
+    times, _ = pd.factorize(df.index.floor(TOPIC_WINDOW))
+    users, _ = pd.factorize(df['id'].values)
+    windows, _ = pd.factorize(users.astype(np.int64) * len(df) + times)
+    order = np.argsort(windows, kind='stable')
+    messages = df['message'].values[order]
+    last = np.flatnonzero(np.diff(windows[order], append=-1))
+    # added as a python string, numpy drops the trailing nul of the separator
+    messages[last] = messages[last] + np.array(SEPARATOR, dtype=object)
+    return ' '.join(messages)[:-len(SEPARATOR)].split(SEPARATOR + ' ')
+
+
+@profiled
+def find_topic_words(messages, engine='top2vec'):
+    """
+    Top topic words of messages, trained once per distinct set of documents,
+    runs in the topic modelling worker processes
+    """
+    if engine == 'nmf':
+        documents, weights = weighted_documents(messages)
+        key = fingerprint(documents, NMF_PARAMS, weights)
+        train = lambda path: save_topics(nmf_topics(documents, weights), path)
+
+    else:
+        documents = normalize_texts(messages)
+        key = fingerprint(documents, TOPIC_PARAMS)
+        train = lambda path: train_topics(documents, path)
+
+    path = topic_cache.get(key)
+    if path is None:
+        path = topic_cache.put(key, train)
+
+    with open(os.path.join(path, 'topics.json')) as f:
+        return json.load(f)
+
+
+@profiled
+def topic_clouds(topic_words):
+    """
+    Returns list of wordclouds of top two topics, as PNG bytes
+    """
+    from wordcloud import WordCloud
+
     clouds = []
-    for topic in topic_words[:2]:
+    for topic in topic_words[:NUM_TOPICS]:
         wc = WordCloud(width=700, height=300, min_font_size=12, background_color='white')
         wc = wc.generate(' '.join(topic))
-        clouds.append(wc)
+        clouds.append(cloud_png(wc))
 
-    del model
-    del documents
     return clouds
+
+
+@profiled
+def get_topics(df, engine=TOPIC_ENGINE):
+    """
+    Preprocesses conversations to prepare it for Topic modelling
+    Returns list of wordclouds of top two topics, as PNG bytes
+    """
+    return topic_clouds(find_topic_words(topic_messages(df, engine), engine))
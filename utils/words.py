@@ -0,0 +1,111 @@
+import io
+import re
+import numpy as np
+import pandas as pd
+from utils.indexing import SharedTable, attached
+
+# words as tokenized by WordCloud.generate: two or more word characters or apostrophes
+WORD_PATTERN = r"\w[\w']+"
+
+# joins distinct messages to tokenize them at once, never part of a word
+SEPARATOR = '\x00'
+
+# word clouds show at most this many words, WordCloud's max_words
+CLOUD_WORDS = 200
+
+
+
+
+class WordTable(SharedTable):
+    """
+    Words of the text messages of a chat, counted once per chat for word clouds,
+    and shared by the frames it was attached to, like the emoji table.
+    Words are lower cased, tokenized like WordCloud.generate without stopwords,
+    numbers, and trailing 's, but without its collocations
+    by_user: number of times each user used each word
+    """
+    key = 'word_table'
+
+    def __init__(self, df):
+        from wordcloud import STOPWORDS
+
+        is_text = np.ones(len(df), dtype=bool)
+        if 'is_media' in df.columns:
+            is_text = ~(df['is_media'].values | df['is_deleted'].values)
+
+        # chats repeat many messages, each distinct message is tokenized once, in one pass
+        # over their text joined by a separator, tokens are numbered by their message
+        codes, uniques = pd.factorize(df['message'].values[is_text])
+        tokens = re.findall(WORD_PATTERN + '|' + SEPARATOR, SEPARATOR.join(uniques).lower())
+        token_codes, vocabulary = pd.factorize(pd.Series(tokens, dtype=object))
+
+        # compared as python strings, numpy drops the trailing nul of the separator
+        vocabulary = pd.Series(vocabulary, dtype=object)
+        is_separator = (vocabulary == SEPARATOR).values
+        separators = is_separator[token_codes]
+        messages = np.cumsum(separators)[~separators]
+        token_codes = token_codes[~separators]
+
+        # each distinct token is cleaned once, stopwords, numbers and separators are dropped
+        words = vocabulary.str.replace(r"'s$", '', regex=True)
+        dropped = vocabulary.isin(STOPWORDS) | words.isin(STOPWORDS) | words.str.isdigit() | is_separator
+        word_codes, words = pd.factorize(words.where(~dropped))
+        token_words = word_codes[token_codes] if len(word_codes) else token_codes
+        kept = token_words >= 0
+
+        # number of times each user sent each distinct message, times the words of the message
+        ids = df['id'].values[is_text]
+        sent = pd.DataFrame({'id': ids, 'code': codes}).groupby(['id', 'code'], observed=True).size()
+        occurrences = sent.rename('count').reset_index().merge(
+            pd.DataFrame({'code': messages[kept], 'word': token_words[kept]}), on='code')
+
+        counts = occurrences.groupby(['id', 'word'], observed=True, sort=False)['count'].sum()
+        self.by_user = pd.Series(counts.values, index=pd.MultiIndex.from_arrays(
+            [counts.index.get_level_values('id'), words[counts.index.get_level_values('word')]],
+            names=['id', 'word']))
+
+    @classmethod
+    def from_counts(cls, counts):
+        """
+        Table of words counted before, from a frame of id, word, and count,
+        such as the counts of each upload of the store, summed per user and word
+        """
+        table = cls.__new__(cls)
+        table.by_user = counts.groupby(['id', 'word'], observed=True, sort=False)['count'].sum()
+        return table
+
+    def frequencies(self, user='Overall'):
+        """
+        Number of times each word was used by user, most used first
+        """
+        if user.lower() == 'overall':
+            counts = self.by_user.groupby(level='word', sort=False).sum()
+
+        elif user in self.by_user.index.get_level_values('id'):
+            counts = self.by_user.xs(user, level='id')
+
+        else:
+            counts = pd.Series([], dtype=np.int64)
+
+        return counts.sort_values(ascending=False, kind='mergesort')
+
+
+
+
+def word_table(df):
+    """
+    Word table of a chat frame, counted on first use and attached to df,
+    so that every later word cloud of the chat reuses it
+    """
+    return attached(df, WordTable.key, WordTable)
+
+
+
+
+def cloud_png(wc):
+    """
+    PNG bytes of a generated word cloud, shown with st.image rather than a pyplot figure
+    """
+    buffer = io.BytesIO()
+    wc.to_image().save(buffer, format='PNG')
+    return buffer.getvalue()